@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import heapq
+import importlib
+import signal
+import time
+
+import config
+from cross_platform import CP
+from probe_runner import ProbeRunner
+from report_state import ReportState, HEARTBEAT_COLUMNS
+
+
+# Resident mode of SystemCheck. Every probe runs once at start-up and then on
+# its own interval from config.daemon_intervals; probes with no interval are
+# treated as once-per-boot. Changes are pushed as soon as they are collected,
+# over a connection held for the life of the daemon. A probe that fails keeps
+# its last good value; until it has had one, its columns are pushed as stale.
+#
+# SIGHUP reloads config.py, SIGTERM marks the host down and exits.
+class SystemCheckDaemon:
+    # Longest single sleep, so signals are acted on promptly.
+    tick = 1.0
+
+    def __init__(self, sc):
+        self.sc = sc
+        self.state = ReportState()
+        # Probes that have failed every time they ran.
+        self.failed = set()
+        self.running = False
+        self.reload_pending = False
+        self.last_push = 0
+
+    def on_hup(self, signum, frame):
+        self.reload_pending = True
+
+    def on_term(self, signum, frame):
+        self.running = False
+
+    # Pick up edits to config.py, including a changed database login.
+    def reload(self):
+        self.reload_pending = False
+        importlib.reload(config)
+
+        if self.sc.location in config.sql_dict:
+            self.sc.db_info = config.sql_dict[self.sc.location]
+        self.sc.sql_close()
+
+    def interval(self, probe):
+        return config.daemon_intervals.get(probe.name)
+
+    # Queue of (due time, probe name) for every probe that repeats.
+    def schedule(self, probes, now):
+        queue = []
+        for probe in probes.values():
+            interval = self.interval(probe)
+            if interval:
+                heapq.heappush(queue, (now + interval, probe.name))
+
+        return queue
+
+    # Run the runner's probes and fold their results into values. A failed
+    # probe's fallback only stands in for a probe with no good value yet.
+    def run_probes(self, runner, values):
+        results, failed = runner.run()
+        for probe, value in results.items():
+            if probe not in failed:
+                values[probe] = value
+                self.failed.discard(probe)
+            elif probe not in values or probe in self.failed:
+                values[probe] = value
+                self.failed.add(probe)
+
+    # Push the current values if anything beyond the heartbeat changed, or
+    # if the heartbeat itself is due.
+    def push(self, name, values):
+        stale = self.sc.stale_columns(self.failed)
+        report = self.state.carry_forward(self.sc.build_report(name, values), stale)
+        update = self.state.delta(report)
+        changed = [column for column in update if column not in HEARTBEAT_COLUMNS]
+        now = time.time()
+
+        if not changed and now - self.last_push < config.daemon_heartbeat:
+            return
+
+        try:
+            self.sc.push_report(report, stale=stale)
+            self.last_push = now
+        except Exception as e:
+            print("Failed to update database.")
+            print(e)
+            # Reconnect on the next push.
+            self.sc.sql_close()
+        finally:
+            self.sc.publish_metrics(name)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self.on_hup)
+        signal.signal(signal.SIGTERM, self.on_term)
+        self.running = True
+
+        name = CP.get_name()
+        self.sc.check_allowed(name)
+
+        runner = ProbeRunner()
+        self.sc.add_probes(runner, self.sc.get_osclass())
+        probes = dict((probe.name, probe) for probe in runner.probes)
+
+        values = {}
+        self.run_probes(runner, values)
+        self.push(name, values)
+        queue = self.schedule(probes, time.time())
+
+        while self.running:
+            if self.reload_pending:
+                self.reload()
+                queue = self.schedule(probes, time.time())
+
+            now = time.time()
+            if not queue or queue[0][0] > now:
+                wait = queue[0][0] - now if queue else self.tick
+                time.sleep(min(wait, self.tick))
+                continue
+
+            due = []
+            while queue and queue[0][0] <= now:
+                due.append(probes[heapq.heappop(queue)[1]])
+
+            runner = ProbeRunner()
+            runner.probes = due
+            self.run_probes(runner, values)
+            self.push(name, values)
+
+            now = time.time()
+            for probe in due:
+                if self.interval(probe):
+                    heapq.heappush(queue, (now + self.interval(probe), probe.name))
+
+        try:
+            self.sc.mark_down(name)
+        except Exception as e:
+            print("Failed to mark host down.")
+            print(e)
+        finally:
+            self.sc.sql_close()
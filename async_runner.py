@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import asyncio
+import os
+import threading
+import time
+from subprocess import PIPE, CalledProcessError, TimeoutExpired
+
+import config
+import probe_runner
+from metrics import METRICS, TIMED_OUT
+from probe_runner import ProbeRunner, command_argv, kill_session, kill_running
+
+# asyncio counterpart of ProbeRunner, used by system_check.py --async. Probes
+# that run commands are coroutines built on run_cmd_async, so nvidia-smi and
+# friends overlap on one event loop instead of holding a thread each while
+# they run. Everything else (sysfs, DMI and wtmp reads, which never block on
+# anything slower than the page cache) runs on a small thread pool. A probe's
+# timeout cancels it, and cancelling run_cmd_async kills its child.
+
+
+# Run an external command on the event loop and return its stdout. Behaves
+# like probe_runner.run_cmd: past the deadline the command's session is
+# killed and TimeoutExpired raised, waiting at most config.reap_timeout for
+# it to go, and commands are remapped, timed and recorded the same way. A
+# cancelled call kills its child the same way before passing the
+# cancellation on.
+async def run_cmd_async(cmd, timeout=None, stderr=PIPE, check=False):
+    if timeout is None:
+        timeout = config.probe_timeout
+
+    argv = command_argv(cmd)
+    command = os.path.basename(argv[0])
+    start = time.time()
+    try:
+        run = await asyncio.create_subprocess_exec(*argv, stdout=PIPE, stderr=stderr,
+                                                   start_new_session=True)
+    except OSError:
+        METRICS.command(command, time.time() - start, 127)
+        raise
+
+    try:
+        out = (await asyncio.wait_for(run.communicate(), timeout))[0]
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        kill_session(run.pid)
+        try:
+            await asyncio.wait_for(run.wait(), config.reap_timeout)
+        except asyncio.TimeoutError:
+            pass
+        METRICS.command(command, time.time() - start, TIMED_OUT)
+        if isinstance(e, asyncio.TimeoutError):
+            raise TimeoutExpired(argv, timeout) from None
+        raise
+    METRICS.command(command, time.time() - start, run.returncode)
+    if check and run.returncode:
+        raise CalledProcessError(run.returncode, argv, out)
+
+    if probe_runner.recorder is not None:
+        probe_runner.recorder(list(cmd), out)
+
+    return out
+
+
+# Runs registered probes as tasks on one event loop. Coroutine functions are
+# awaited directly; at most config.async_probe_workers plain functions run at
+# once, each on its own daemon thread. As with ProbeRunner, a plain probe's
+# deadline starts when its thread does, a thread left behind by a probe that
+# timed out doesn't count against the limit or hold up exit, and a cached
+# value is served without running the probe.
+class AsyncProbeRunner(ProbeRunner):
+    coroutines = True
+
+    def __init__(self, workers=None, cache=None):
+        ProbeRunner.__init__(self, workers or config.async_probe_workers, cache)
+
+    # Call a plain probe on a daemon thread and return a future for its
+    # result on loop.
+    def _start_thread(self, loop, probe):
+        future = loop.create_future()
+
+        def settle(value, error):
+            if not future.done():
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(value)
+
+        def work():
+            try:
+                value, error = probe.func(*probe.args), None
+            except Exception as e:
+                value, error = None, e
+            # The loop is gone if the run finished without us.
+            try:
+                loop.call_soon_threadsafe(settle, value, error)
+            except RuntimeError:
+                pass
+
+        threading.Thread(target=work, daemon=True).start()
+
+        return future
+
+    async def _call(self, probe, slots):
+        if asyncio.iscoroutinefunction(probe.func):
+            return await asyncio.wait_for(probe.func(*probe.args), probe.timeout)
+
+        async with slots:
+            future = self._start_thread(asyncio.get_running_loop(), probe)
+            return await asyncio.wait_for(future, probe.timeout)
+
+    # Run one probe, record how it went and return (value, True), or
+    # (fallback, False) if it failed.
+    async def _run_probe(self, probe, slots):
+        start = time.time()
+        try:
+            value = await self._call(probe, slots)
+        except asyncio.TimeoutError:
+            METRICS.probe(probe.name, time.time() - start, 'timeout')
+            return probe.fallback, False
+        except Exception as e:
+            METRICS.probe(probe.name, time.time() - start, 'error', type(e).__name__)
+            return probe.fallback, False
+
+        METRICS.probe(probe.name, time.time() - start, 'ok')
+        self.store(probe, value)
+
+        return value, True
+
+    # Run every registered probe on the current event loop and return
+    # ({name: value}, failed), like ProbeRunner.run.
+    async def run_async(self):
+        results = {}
+        failed = set()
+        pending = []
+        slots = asyncio.Semaphore(self.workers)
+
+        for probe in self.probes:
+            hit, value = self.cached(probe)
+            if hit:
+                results[probe.name] = value
+                METRICS.probe(probe.name, 0, 'cached')
+            else:
+                pending.append(probe)
+
+        outcomes = await asyncio.gather(*[self._run_probe(probe, slots) for probe in pending])
+        for probe, (value, ok) in zip(pending, outcomes):
+            results[probe.name] = value
+            if not ok:
+                failed.add(probe.name)
+
+        # Plain probes that timed out may have left commands running.
+        kill_running()
+
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except (IOError, OSError):
+                pass
+
+        return results, failed
+
+    # Run every registered probe on a new event loop.
+    def run(self):
+        return asyncio.run(self.run_async())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from optparse import OptionParser
+
+import config
+from async_runner import AsyncProbeRunner
+from bench_probes import agent, measure, write_stubs
+from probe_runner import ProbeRunner
+
+# Compares the ways the agent can run one collection, against a fixture
+# recorded with bench_probes.py record:
+#
+#   sequential  ProbeRunner with one worker, one probe after another
+#   threaded    ProbeRunner with config.probe_workers threads (the default)
+#   asyncio     AsyncProbeRunner: commands on one event loop, file reads on
+#               config.async_probe_workers threads
+#
+# Each run is a fresh child with no probe cache. --latency makes every
+# replayed command sleep first, standing in for a slow nvidia-smi. --push
+# also writes each report (full) to the configured database, so the asyncio
+# run's connect overlaps its probes.
+
+MODES = ['sequential', 'threaded', 'asyncio']
+
+
+def collect(sc, mode):
+    if mode == 'sequential':
+        return sc.get_updates(ProbeRunner(workers=1))[2]
+    elif mode == 'threaded':
+        return sc.get_updates(ProbeRunner())[2]
+
+    return sc.get_updates(AsyncProbeRunner())[2]
+
+
+def push(sc, mode):
+    import asyncio
+
+    if mode == 'sequential':
+        sc.do_update(True, ProbeRunner(workers=1))
+    elif mode == 'threaded':
+        sc.do_update(True, ProbeRunner())
+    else:
+        asyncio.run(sc.do_update_async(True, AsyncProbeRunner()))
+
+
+def bench(fixture, runs, latency, with_push):
+    with open(os.path.join(fixture, 'manifest.json'), 'r') as data:
+        manifest = json.load(data)
+
+    scratch = tempfile.mkdtemp(prefix='bench_async.')
+    bindir = os.path.join(scratch, 'bin')
+    os.makedirs(bindir)
+    forks = os.path.join(scratch, 'forks')
+    write_stubs(os.path.abspath(fixture), manifest, bindir, forks, latency / 1000.0)
+
+    config.host_root = os.path.join(os.path.abspath(fixture), 'root')
+    config.command_dir = bindir
+    config.state_dir = os.path.join(scratch, 'state')
+
+    try:
+        sc = agent()
+        run = push if with_push else collect
+        print("{0} commands replayed, {1:.0f} ms each".format(len(manifest['commands']), latency))
+        print("{0:<12} {1:>8} {2:>10} {3:>10} {4:>6} {5:>10}".format(
+            "mode", "threads", "median ms", "max ms", "forks", "peak KiB"))
+
+        threads = {'sequential': 1, 'threaded': config.probe_workers,
+                   'asyncio': config.async_probe_workers}
+        for mode in MODES:
+            samples = [measure(lambda: run(sc, mode), forks) for attempt in range(runs)]
+            errors = [sample[3]['error'] for sample in samples if 'error' in sample[3]]
+            walls = sorted(sample[0] for sample in samples)
+            print("{0:<12} {1:>8} {2:>10.1f} {3:>10.1f} {4:>6} {5:>10}  {6}".format(
+                mode, threads[mode], walls[len(walls) // 2] * 1000, walls[-1] * 1000,
+                samples[0][1], max(sample[2] for sample in samples),
+                errors[0] if errors else 'ok'))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def parse_options():
+    parser = OptionParser(usage="%prog -i FIXTURE")
+    parser.add_option("-i", "--input", action="store", dest="input",
+                      help="Fixture directory recorded by bench_probes.py record")
+    parser.add_option("-r", "--runs", type="int", action="store", dest="runs", default=5,
+                      help="Runs per mode; the median and slowest wall times are reported")
+    parser.add_option("-l", "--latency", type="float", action="store", dest="latency", default=0,
+                      help="Milliseconds every replayed command sleeps before answering")
+    parser.add_option("-p", "--push", action="store_true", dest="push", default=False,
+                      help="Also push each report to the configured database")
+
+    (options, args) = parser.parse_args()
+
+    if not options.input:
+        parser.print_help()
+        sys.exit(2)
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+    bench(options.input, options.runs, options.latency, options.push)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import random
+import re
+import time
+from optparse import OptionParser
+
+import config
+from classify import Classifier
+
+# Classifies a synthetic corpus of GPU and CPU names with the old approach
+# (an uncompiled re.search per pattern per name, last match wins) and with
+# classify.Classifier, with and without its per-name cache. For GPUs it also
+# reports how many names config.gpu_arch_rules now classifies differently
+# from the old gpu_arch_dict, i.e. what the rule reordering changed. There
+# was no CPU table before, so CPUs have nothing to compare against.
+
+GPU_NAMES = [
+    'Quadro RTX 6000', 'Quadro RTX 8000', 'Quadro RTX A6000', 'NVIDIA RTX A6000',
+    'NVIDIA RTX A5000', 'NVIDIA A100-SXM4-40GB', 'Quadro P5000', 'Quadro P6000',
+    'Quadro M6000', 'Quadro K5200', 'Quadro GV100', 'Quadro GP100', 'TITAN Xp',
+    'GeForce GTX 1080 Ti', 'GeForce GTX 980', 'GeForce GTX TITAN X',
+    'GeForce GTX 780', 'GeForce RTX 2080 Ti', 'GeForce RTX 3090', 'Tesla V100-PCIE-16GB',
+    'Quadro 4000', 'Quadro FX 5800', 'Quadro FX 1500', 'Matrox G200eR2',
+]
+
+# config.gpu_arch_dict as it was before gpu_arch_rules replaced it, in its
+# dict order.
+LEGACY_GPU_ARCH = [
+    ('Quadro RTX [0-9]*', 'turing'),
+    ('Quadro GV[0-9]*', 'volta'),
+    ('Quadro GP[0-9]*', 'pascal'),
+    ('Quadro P[0-9]{4}', 'pascal'),
+    ('TITAN Xp', 'pascal'),
+    ('GTX 10[0-9]{2}', 'pascal'),
+    ('Quadro M[0-9]{4}', 'maxwell'),
+    ('GTX TITAN X', 'maxwell'),
+    ('GTX 9[0-9]{2}', 'maxwell'),
+    ('Quadro K[0-9]{4}', 'kepler'),
+    ('GTX TITAN Black', 'kepler'),
+    ('GTX [6-7][0-9]{2}', 'kepler'),
+    ('Quadro [0-9]{4}', 'fermi'),
+    ('GTX [5][0-9]{2}', 'fermi'),
+    ('Quadro FX [3-9][0-9]{3}', 'tesla'),
+    ('Quadro FX 770M', 'tesla'),
+    ('Quadro FX 1500', 'curie'),
+    ('Tesla V[0-9]{3}', 'volta'),
+    ('Quadro RTX A[0-9]{4}', 'ampere'),
+    ('GeForce RTX 20[0-9]{2}', 'turing'),
+]
+
+CPU_NAMES = [
+    'Intel(R) Xeon(R) Gold 6248R CPU @ 3.00GHz', 'Intel(R) Xeon(R) Gold 6148 CPU @ 2.40GHz',
+    'Intel(R) Xeon(R) Silver 4316 CPU @ 2.30GHz', 'Intel(R) Xeon(R) CPU E5-2680 v4 @ 2.40GHz',
+    'Intel(R) Xeon(R) CPU E5-2687W v3 @ 3.10GHz', 'Intel(R) Xeon(R) CPU E5-2670 0 @ 2.60GHz',
+    'Intel(R) Xeon(R) W-2295 CPU @ 3.00GHz', 'Intel(R) Core(TM) i9-10900K CPU @ 3.70GHz',
+    'Intel(R) Core(TM) i7-8700K CPU @ 3.70GHz', 'Intel(R) Core(TM) i7-4790 CPU @ 3.60GHz',
+    'AMD Ryzen Threadripper 3990X 64-Core Processor',
+    'AMD Ryzen Threadripper PRO 3995WX 64-Cores', 'AMD Ryzen 9 5950X 16-Core Processor',
+    'AMD EPYC 7742 64-Core Processor', 'QEMU Virtual CPU version 2.5+',
+]
+
+
+# The loop get_gpu_arch used to run: every pattern, every name, last wins.
+def legacy_classify(rules, name):
+    arch = ''
+    for pattern, label in rules:
+        if re.search(pattern, name):
+            arch = label
+
+    return arch
+
+
+# A fleet's worth of names, mostly repeats as in a real inventory, with a
+# share of one-off names (odd board partner suffixes and the like).
+def make_corpus(names, size, unique_ratio, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(size):
+        name = rng.choice(names)
+        if rng.random() < unique_ratio:
+            name = '{0} rev{1}'.format(name, index)
+        corpus.append(name)
+
+    return corpus
+
+
+# Wall time in ms for func over the corpus, and its results.
+def measure(func, corpus):
+    start = time.time()
+    results = [func(name) for name in corpus]
+
+    return (time.time() - start) * 1000, results
+
+
+def parse_options():
+    parser = OptionParser()
+    parser.add_option("-n", "--names", type="int", action="store", dest="names", default=200000,
+                      help="Names in each corpus")
+    parser.add_option("-u", "--unique", type="float", action="store", dest="unique", default=0.01,
+                      help="Share of names that only appear once")
+    parser.add_option("--seed", type="int", action="store", dest="seed", default=1,
+                      help="Random seed for the corpus")
+
+    (options, args) = parser.parse_args()
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+
+    print("{0:<5} {1:>8} {2:>12} {3:>14} {4:>14} {5:>10}".format(
+        "rules", "names", "legacy ms", "compiled ms", "memoised ms", "changed"))
+
+    # The legacy loop runs the old table where there was one, so its results
+    # are what the agent used to report; otherwise it runs the new rules
+    # reversed, to time the same amount of matching.
+    for label, rules, names, legacy_rules in [
+            ('gpu', config.gpu_arch_rules, GPU_NAMES, LEGACY_GPU_ARCH),
+            ('cpu', config.cpu_arch_rules, CPU_NAMES, None)]:
+        corpus = make_corpus(names, options.names, options.unique, options.seed)
+
+        baseline = legacy_rules or list(reversed(rules))
+        legacy_ms, legacy = measure(lambda name: legacy_classify(baseline, name), corpus)
+
+        uncached = Classifier(rules, cache_size=0)
+        compiled_ms, compiled = measure(uncached.classify, corpus)
+
+        cached = Classifier(rules)
+        memoised_ms, memoised = measure(cached.classify, corpus)
+
+        changed = '-'
+        if legacy_rules:
+            changed = len([1 for old, new in zip(legacy, memoised) if old != new])
+        print("{0:<5} {1:>8} {2:>12.1f} {3:>14.1f} {4:>14.1f} {5:>10}".format(
+            label, len(corpus), legacy_ms, compiled_ms, memoised_ms, changed))
+
+        # Which names moved, and from what to what.
+        if legacy_rules:
+            moves = {}
+            for name, old, new in zip(corpus, legacy, memoised):
+                if old != new:
+                    base = re.sub(' rev[0-9]+$', '', name)
+                    moves.setdefault((old or '-', new or '-'), set()).add(base)
+            for (old, new), moved in sorted(moves.items()):
+                print("      {0} -> {1}: {2}".format(old, new, ", ".join(sorted(moved))))
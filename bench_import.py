@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import sys
+from optparse import OptionParser
+
+# Import-time budget for the agent. Runs system_check.py --collect under
+# python -X importtime and totals what the agent itself imports: modules a
+# bare `python -c pass` also loads are interpreter startup (site, encodings,
+# ...) and are left out. Lists the slowest of the agent's imports, and fails
+# if their total is over budget or if collect-only mode pulled in anything it
+# shouldn't need.
+
+# Modules --collect must not load. The database driver, mail and HTTP client
+# are only for pushing, and the daemon only for --daemon.
+FORBIDDEN = ['psycopg2', 'smtplib', 'email', 'http.client', 'urllib.request', 'agent_daemon']
+
+
+# Run python once with args and return [(module, self us, cumulative us)]
+# from the -X importtime report, in import order.
+def import_times(args):
+    run = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    times = []
+    for line in run.stderr.decode("utf-8", "replace").splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times.append((module.strip(), int(self_us), int(cumulative_us)))
+
+    return times
+
+
+# The agent's own imports from one run: everything not loaded at startup.
+def agent_times(script, startup):
+    return [entry for entry in import_times([script, '--collect']) if entry[0] not in startup]
+
+
+def parse_options():
+    parser = OptionParser()
+    parser.add_option("-b", "--budget", type="float", action="store", dest="budget", default=60,
+                      help="Fail if the agent's imports take longer than this many ms in total")
+    parser.add_option("-n", "--top", type="int", action="store", dest="top", default=15,
+                      help="Number of slowest modules to list")
+    parser.add_option("-r", "--runs", type="int", action="store", dest="runs", default=5,
+                      help="Runs to take the median total from")
+
+    (options, args) = parser.parse_args()
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+    script = os.path.join(sys.path[0], 'system_check.py')
+
+    startup = set(module for module, self_us, cumulative_us in import_times(['-c', 'pass']))
+    runs = [agent_times(script, startup) for run in range(options.runs)]
+    runs.sort(key=lambda times: sum(self_us for module, self_us, cumulative_us in times))
+    times = runs[len(runs) // 2]
+    total = sum(self_us for module, self_us, cumulative_us in times) / 1000.0
+
+    print("{0:<32} {1:>10} {2:>14}".format("module", "self ms", "cumulative ms"))
+    for module, self_us, cumulative_us in sorted(times, key=lambda t: -t[1])[:options.top]:
+        print("{0:<32} {1:>10.1f} {2:>14.1f}".format(module, self_us / 1000.0, cumulative_us / 1000.0))
+    print("{0} modules, {1:.1f} ms total excluding interpreter startup, budget {2:.0f} ms".format(
+        len(times), total, options.budget))
+
+    loaded = set(module for module, self_us, cumulative_us in times)
+    forbidden = [module for module in FORBIDDEN if module in loaded]
+    if forbidden:
+        print("--collect imported: " + ", ".join(forbidden))
+    if forbidden or total > options.budget:
+        sys.exit(1)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+import glob
+import json
+import os
+import resource
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+import config
+import probe_runner
+
+# Record-and-replay benchmark for the agent's probes.
+#
+#   bench_probes.py record -o FIXTURE   on a real machine: run every probe
+#       once, saving each command's output, the host files the probes read,
+#       and what each probe returned.
+#   bench_probes.py replay -i FIXTURE   anywhere: point config.host_root at the
+#       saved files and config.command_dir at stub scripts that print the
+#       saved output, then run each probe (and a full get_updates) in its own
+#       child process and report wall time, commands forked, peak RSS and
+#       whether the result still matches the recording.
+#
+# replay exits non-zero when a probe's result changed, or ran past --budget,
+# so it can gate CI on a plain Linux box.
+
+# Host files the Linux probes read directly. Globs are expanded when recording.
+HOST_FILES = [
+    '/proc/cpuinfo',
+    '/var/log/Xorg.0.log',
+    '/var/log/wtmp',
+    '/sys/firmware/dmi/tables/DMI',
+    '/sys/class/dmi/id/*',
+    '/sys/class/drm/*/status',
+    '/sys/class/drm/*/edid',
+    '/sys/devices/system/cpu/online',
+    '/sys/devices/system/cpu/cpu*/topology/physical_package_id',
+    '/sys/devices/system/cpu/cpu*/topology/thread_siblings_list',
+    '/sys/devices/system/cpu/cpu*/cache/index*/type',
+    '/sys/devices/system/cpu/cpu*/cache/index*/level',
+    '/sys/devices/system/cpu/cpu*/cache/index*/size',
+    '/sys/devices/system/cpu/cpu*/cache/index*/shared_cpu_list',
+    '/sys/devices/system/node/node*/cpulist',
+    '/sys/devices/system/node/node*/meminfo',
+    '/sys/bus/pci/devices/*/class',
+    '/sys/bus/pci/devices/*/vendor',
+    '/sys/bus/pci/devices/*/device',
+    '/sys/bus/usb/devices/*/idVendor',
+    '/sys/bus/usb/devices/*/idProduct',
+    '/sys/bus/usb/devices/*/bDeviceClass',
+    '/sys/bus/usb/devices/*/manufacturer',
+    '/sys/bus/usb/devices/*/product',
+    '/sys/block/*/size',
+    '/sys/block/*/removable',
+    '/sys/block/*/queue/rotational',
+    '/sys/block/*/device/model',
+    # Not read, but keeps the device directory of disks with no model.
+    '/sys/block/*/device/vendor',
+    '/sys/block/*/device/serial',
+    '/dev/disk/by-id/*',
+]
+
+# Probes that don't come from a recorded command or file, so their result
+# depends on the machine replaying and isn't compared.
+UNRECORDED = ['ipaddr']
+
+
+# Stand-in for SystemCheck's ProbeRunner that just collects the probes, so
+# the list comes from SystemCheck.add_probes and can't drift from the agent.
+class ProbeList:
+    coroutines = False
+
+    def __init__(self):
+        self.probes = []
+
+    def add(self, name, func, *args, **kwargs):
+        self.probes.append((name, func, args))
+
+
+def agent():
+    import system_check
+
+    return system_check.SystemCheck(config.sql_dict)
+
+
+def probe_list(sc):
+    probes = ProbeList()
+    sc.add_probes(probes, sc.get_osclass())
+
+    return probes.probes
+
+
+# JSON-normalised probe result, so tuples and lists compare equal.
+def normalise(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+
+    return json.loads(json.dumps(value, default=str))
+
+
+def record(fixture):
+    commands = []
+
+    def save_output(cmd, out):
+        path = os.path.join('out', '{0}.out'.format(len(commands)))
+        with open(os.path.join(fixture, path), 'wb') as data:
+            data.write(out)
+        commands.append({'argv': cmd, 'out': path})
+
+    os.makedirs(os.path.join(fixture, 'out'), exist_ok=True)
+    root = os.path.join(fixture, 'root')
+    for pattern in HOST_FILES:
+        for path in glob.glob(pattern):
+            target = os.path.join(root, path.lstrip('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                # /dev/disk/by-id is symlinks to the disks, which is what the
+                # probe reads, not the devices behind them.
+                if os.path.islink(path):
+                    os.symlink(os.readlink(path), target)
+                else:
+                    shutil.copyfile(path, target)
+            except (IOError, OSError) as e:
+                print("skipped {0}: {1}".format(path, e))
+
+    probe_runner.recorder = save_output
+    expected = {}
+    for name, func, args in probe_list(agent()):
+        try:
+            expected[name] = {'value': normalise(func(*args))}
+        except Exception as e:
+            expected[name] = {'error': type(e).__name__}
+    probe_runner.recorder = None
+
+    with open(os.path.join(fixture, 'manifest.json'), 'w') as data:
+        json.dump({'commands': commands, 'expected': expected}, data, indent=1, sort_keys=True)
+
+    print("recorded {0} commands and {1} probes to {2}".format(
+        len(commands), len(expected), fixture))
+
+
+# One sh script per command name that prints the recorded output for the
+# recorded arguments, and counts each call in the forks file. With delay, each
+# call first sleeps that many seconds, to stand in for a slow tool.
+def write_stubs(fixture, manifest, bindir, forks, delay=0):
+    cases = {}
+    for command in manifest['commands']:
+        name = os.path.basename(command['argv'][0])
+        args = ' '.join(command['argv'][1:])
+        cases.setdefault(name, {})[args] = os.path.join(fixture, command['out'])
+
+    for name, outputs in cases.items():
+        lines = ['#!/bin/sh', 'echo >> {0}'.format(shlex.quote(forks))]
+        if delay:
+            lines.append('sleep {0}'.format(delay))
+        lines.append('case "$*" in')
+        for args, out in outputs.items():
+            lines.append('    {0}) exec cat {1} ;;'.format(shlex.quote(args), shlex.quote(out)))
+        lines.extend(['esac', 'exit 1', ''])
+
+        path = os.path.join(bindir, name)
+        with open(path, 'w') as data:
+            data.write('\n'.join(lines))
+        os.chmod(path, 0o755)
+
+
+def count_forks(forks):
+    try:
+        with open(forks, 'r') as data:
+            return len(data.readlines())
+    except (IOError, OSError):
+        return 0
+
+
+# Run func in a forked child. Returns (wall seconds, forks, peak RSS in KiB,
+# result) where result is {'value': ...} or {'error': type name}.
+def measure(func, forks):
+    before = count_forks(forks)
+    reader, writer = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(reader)
+        start = time.time()
+        try:
+            result = {'value': normalise(func())}
+        except BaseException as e:
+            result = {'error': type(e).__name__}
+        result['wall'] = time.time() - start
+        with os.fdopen(writer, 'w') as data:
+            json.dump(result, data)
+        os._exit(0)
+
+    os.close(writer)
+    with os.fdopen(reader, 'r') as data:
+        payload = data.read()
+    _, status, usage = os.wait4(pid, 0)
+
+    try:
+        result = json.loads(payload)
+    except ValueError:
+        result = {'error': 'exit status {0}'.format(status), 'wall': 0}
+    wall = result.pop('wall', 0)
+
+    return wall, count_forks(forks) - before, usage.ru_maxrss, result
+
+
+def replay(fixture, runs, budget):
+    with open(os.path.join(fixture, 'manifest.json'), 'r') as data:
+        manifest = json.load(data)
+
+    scratch = tempfile.mkdtemp(prefix='bench_probes.')
+    bindir = os.path.join(scratch, 'bin')
+    os.makedirs(bindir)
+    forks = os.path.join(scratch, 'forks')
+    write_stubs(os.path.abspath(fixture), manifest, bindir, forks)
+
+    config.host_root = os.path.join(os.path.abspath(fixture), 'root')
+    config.command_dir = bindir
+    config.state_dir = os.path.join(scratch, 'state')
+
+    failed = False
+    try:
+        sc = agent()
+        print("baseline RSS {0} KiB".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        print("{0:<12} {1:>10} {2:>6} {3:>10}  {4}".format("probe", "wall ms", "forks", "peak KiB", "result"))
+
+        for name, func, args in probe_list(sc):
+            samples = [measure(lambda: func(*args), forks) for run in range(runs)]
+            samples.sort(key=lambda sample: sample[0])
+            wall, nforks, rss, result = samples[len(samples) // 2]
+
+            expected = manifest['expected'].get(name)
+            if name in UNRECORDED:
+                status = 'not recorded'
+            elif expected is None:
+                status = 'new'
+            elif result == expected:
+                status = 'ok'
+            else:
+                status = 'changed: {0} != {1}'.format(result, expected)
+                failed = True
+            if budget and wall * 1000 > budget:
+                status += ' (over budget)'
+                failed = True
+
+            print("{0:<12} {1:>10.1f} {2:>6} {3:>10}  {4}".format(
+                name, wall * 1000, nforks, max(sample[2] for sample in samples), status))
+
+        # Cold then warm: the second run is answered from the probe cache.
+        for label in ['get_updates', 'get_updates*']:
+            wall, nforks, rss, result = measure(lambda: sc.get_updates()[2], forks)
+            status = result.get('error', 'ok')
+            print("{0:<12} {1:>10.1f} {2:>6} {3:>10}  {4}".format(
+                label, wall * 1000, nforks, rss, status))
+        print("* served from the probe cache written by the first run")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return failed
+
+
+def parse_options():
+    parser = OptionParser(usage="%prog record -o FIXTURE | replay -i FIXTURE")
+    parser.add_option("-o", "--output", action="store", dest="output",
+                      help="Fixture directory to record into")
+    parser.add_option("-i", "--input", action="store", dest="input",
+                      help="Fixture directory to replay")
+    parser.add_option("-r", "--runs", type="int", action="store", dest="runs", default=5,
+                      help="Runs per probe; the median wall time is reported")
+    parser.add_option("-b", "--budget", type="float", action="store", dest="budget", default=0,
+                      help="Fail if any probe's median wall time exceeds this many ms")
+
+    (options, args) = parser.parse_args()
+
+    if args[:1] == ['record'] and options.output:
+        return options, args
+    if args[:1] == ['replay'] and options.input:
+        return options, args
+
+    parser.print_help()
+    sys.exit(2)
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+
+    if args[0] == 'record':
+        record(options.output)
+    elif replay(options.input, options.runs, options.budget):
+        sys.exit(1)
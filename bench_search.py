@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+from psycopg2 import connect
+
+import config
+import syscheckdb
+
+# Compares syscheckdb's old -a query (a 25-way OR of LIKEs) against the
+# trigram-indexed search column, and the heartbeat filters against the old -a
+# run over their values, on a synthetic table. Every scan in each indexed
+# plan is listed, so a sequential scan shows up. Everything is created in a
+# scratch schema that is dropped afterwards; run it against a scratch
+# database anyway.
+
+SCHEMA = 'syscheck_bench'
+
+# Columns the old -a query ORed over, in its order. Some were CAST to CHAR.
+LEGACY_COLUMNS = [
+    'name', 'class', 'ipaddr', 'macaddr', 'cpuname', 'procs', 'ram', 'ramspeed',
+    'gpu', 'gpuserial', 'ssd', 'tablet', 'monitor1', 'serial1', 'monitor2',
+    'serial2', 'CAST(lastupdate AS CHAR)', 'lastuser', 'CAST(lastlogon AS CHAR)',
+    'lastos', 'state', 'uptime', 'CAST(nvme AS CHAR)', 'mbserial', 'gpuram',
+    'CAST(gpuarch AS CHAR)',
+]
+
+# Patterns in the shape people actually search for.
+PATTERNS = ['ws-04211', 'user17', 'Quadro RTX 6000', 'S4EVNX0N0%', '%A6000%']
+
+# Heartbeat filters as (option, value, the -a pattern that stood in for it).
+# --updated-before had no -a equivalent; its value comes from the database
+# clock.
+FILTERS = [
+    ('state', 'down', 'down'),
+    ('uptime', 'up 399 days', 'up 399 days'),
+    ('updated_before', None, None),
+]
+
+# A fleet of fake hosts. The % operators are doubled because the row count is
+# passed as a query parameter.
+SYNTHETIC_ROWS = """
+INSERT INTO system_check (name, class, ipaddr, macaddr, cpuname, procs, hyperthread,
+    ram, ramspeed, gpu, gpuserial, ssd, tablet, monitor1, serial1, monitor2, serial2,
+    lastupdate, lastuser, lastlogon, lastos, state, uptime, nvme, mbserial, gpuram, gpuarch)
+SELECT 'ws-' || lpad(i::text, 5, '0'), 'NA',
+    '10.' || (i / 65536 %% 256) || '.' || (i / 256 %% 256) || '.' || (i %% 256),
+    '02:00:00:' || lpad(to_hex(i %% 16777216), 6, '0'),
+    (ARRAY['Intel(R) Xeon(R) Gold 6248R CPU @ 3.00GHz', 'AMD Ryzen Threadripper 3990X',
+           'Intel(R) Core(TM) i9-10900K CPU @ 3.70GHz'])[1 + i %% 3],
+    (ARRAY['8', '16', '24', '64'])[1 + i %% 4], '1',
+    (ARRAY['64', '128', '256'])[1 + i %% 3], '2933',
+    (ARRAY['Quadro RTX 6000', 'NVIDIA RTX A6000', 'Quadro P5000', 'GeForce RTX 2080 Ti'])[1 + i %% 4],
+    (1320000000000 + i)::text, 'S4EVNX0N' || lpad(i::text, 6, '0'),
+    CASE WHEN i %% 7 = 0 THEN 'Intuos Pro M' ELSE '' END,
+    'DELL U2720Q', 'CN0' || i, 'DELL U2720Q', 'CN1' || i,
+    now() - (i %% 1000) * interval '1 minute', 'user' || (i %% 3000),
+    current_date - i %% 90, 'cent7_64', CASE WHEN i %% 50 = 0 THEN 'down' ELSE 'up' END,
+    'up ' || (i %% 400) || ' days',
+    i %% 2, 'MB' || lpad(i::text, 8, '0'), '24576',
+    (ARRAY['turing', 'ampere', 'pascal', 'turing'])[1 + i %% 4]
+FROM generate_series(1, %s) AS i
+"""
+
+
+def legacy_query(pattern):
+    where = " OR ".join("{0} LIKE %s".format(column) for column in LEGACY_COLUMNS)
+
+    return "SELECT * FROM system_check WHERE " + where, [pattern] * len(LEGACY_COLUMNS)
+
+
+def indexed_query(pattern, **filters):
+    class Options:
+        machine = None
+        all = pattern
+
+    for option, value in filters.items():
+        setattr(Options, option, value)
+
+    return syscheckdb.build_query(Options)
+
+
+# Every scan node in a plan, e.g. "Bitmap Index Scan".
+def scans(plan):
+    found = [plan['Node Type']] if 'Scan' in plan['Node Type'] else []
+    for child in plan.get('Plans', []):
+        found += [scan for scan in scans(child) if scan not in found]
+
+    return found
+
+
+# Median wall time of a query in ms, plus the scans in its plan.
+def measure(cursor, sql, params, runs):
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()[0][0]['Plan']
+
+    times = []
+    for run in range(runs):
+        start = time.time()
+        cursor.execute(sql, params)
+        rows = len(cursor.fetchall())
+        times.append((time.time() - start) * 1000)
+    times.sort()
+
+    return times[len(times) // 2], rows, ", ".join(scans(plan))
+
+
+def parse_options():
+    parser = OptionParser()
+    parser.add_option("-l", "--location", action="store", dest="location", default="home",
+                      help="Database from config.sql_dict to benchmark against")
+    parser.add_option("-n", "--rows", type="int", action="store", dest="rows", default=100000,
+                      help="Synthetic rows to load")
+    parser.add_option("-r", "--runs", type="int", action="store", dest="runs", default=5,
+                      help="Runs per query; the median is reported")
+
+    (options, args) = parser.parse_args()
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+    sqldb = connect(config.sql_dict[options.location])
+    sqldb.autocommit = True
+    cursor = sqldb.cursor()
+
+    cursor.execute("DROP SCHEMA IF EXISTS {0} CASCADE".format(SCHEMA))
+    cursor.execute("CREATE SCHEMA {0}".format(SCHEMA))
+    cursor.execute("SET search_path TO {0}, public".format(SCHEMA))
+
+    try:
+        with open(os.path.join(sys.path[0], 'schema.sql'), 'r') as data:
+            cursor.execute(data.read())
+
+        start = time.time()
+        cursor.execute(SYNTHETIC_ROWS, [options.rows])
+        cursor.execute("ANALYZE system_check")
+        print("loaded {0} rows in {1:.1f}s".format(options.rows, time.time() - start))
+
+        print("{0:<28} {1:>6} {2:>10} {3:>10} {4:>10}  {5}".format(
+            "pattern", "rows", "legacy ms", "legacy plan", "indexed ms", "indexed plan"))
+
+        cursor.execute("SELECT (now() - interval '990 minutes')::timestamp::text")
+        stale = cursor.fetchone()[0]
+        cases = [(pattern, pattern, indexed_query(pattern)) for pattern in PATTERNS]
+        for option, value, legacy in FILTERS:
+            value = value or stale
+            cases.append(("--{0} {1}".format(option.replace('_', '-'), value), legacy,
+                          indexed_query(None, **{option: value})))
+
+        for label, legacy, (sql, params) in cases:
+            legacy_ms, legacy_plan = "-", "-"
+            if legacy:
+                legacy_ms, rows, legacy_plan = measure(cursor, *legacy_query(legacy),
+                                                       runs=options.runs)
+                legacy_ms = "{0:.1f}".format(legacy_ms)
+            indexed_ms, rows, indexed_plan = measure(cursor, sql, params, options.runs)
+            print("{0:<28} {1:>6} {2:>10} {3:>10} {4:>10.1f}  {5}".format(
+                label, rows, legacy_ms, legacy_plan, indexed_ms, indexed_plan))
+    finally:
+        cursor.execute("SET search_path TO DEFAULT")
+        cursor.execute("DROP SCHEMA IF EXISTS {0} CASCADE".format(SCHEMA))
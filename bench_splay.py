@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import heapq
+import random
+from optparse import OptionParser
+
+import config
+from cross_platform import CrossPlatform
+
+# Simulates a fleet on one cron schedule and reports the peak number of
+# concurrent database connections, and of concurrent writers, with and
+# without --splay and with an admission limit. No database is needed; each
+# host connects once its probes finish and holds the connection for its
+# write time. Under admission, each try also holds a connection for one
+# round trip, and a refused agent either disconnects while it waits (as the
+# agent does) or, for comparison, holds its connection throughout.
+
+# Seconds a connection is held for one admission query.
+ADMIT_TIME = 0.005
+
+
+# Peak number of overlapping (start, end) intervals.
+def peak_concurrency(intervals):
+    events = []
+    for start, end in intervals:
+        events.append((start, 1))
+        events.append((end, -1))
+    events.sort()
+
+    peak = current = 0
+    for when, change in events:
+        current += change
+        peak = max(peak, current)
+
+    return peak
+
+
+# Each host's (probe time, write time), drawn once so every scenario sees the
+# same fleet.
+def make_fleet(hosts, seed):
+    rng = random.Random(seed)
+    fleet = []
+    for index in range(hosts):
+        name = 'ws-{0:05d}'.format(index)
+        probe = rng.lognormvariate(0.5, 0.6)
+        write = rng.lognormvariate(-2.5, 0.8)
+        fleet.append((name, probe, write))
+
+    return fleet
+
+
+# Connection intervals for one cron tick, with each host offset by its splay.
+def connections(fleet, interval):
+    CP = CrossPlatform()
+    intervals = []
+    for name, probe, write in fleet:
+        start = CP.get_splay(interval, name) + probe
+        intervals.append((start, start + write))
+
+    return intervals
+
+
+# Replay write intervals through a server that admits at most slots writers
+# at once. Refused agents retry after a random wait, as the agent does, up to
+# retries tries in all. Returns (write intervals, connection intervals,
+# number of hosts deferred to the spool). With hold, a refused agent keeps
+# its connection open while it waits.
+def admit(intervals, slots, wait, retries, seed, hold=False):
+    rng = random.Random(seed)
+    # (time of this try, time of the first try, write length, try number)
+    tries = [(start, start, end - start, 0) for start, end in intervals]
+    heapq.heapify(tries)
+    writing = []
+    writes = []
+    connections = []
+    deferred = 0
+
+    while tries:
+        when, first, length, attempt = heapq.heappop(tries)
+        while writing and writing[0] <= when:
+            heapq.heappop(writing)
+
+        if len(writing) < slots:
+            heapq.heappush(writing, when + length)
+            writes.append((when, when + length))
+            connections.append((first if hold else when, when + length))
+            continue
+
+        if not hold:
+            connections.append((when, when + ADMIT_TIME))
+        if attempt + 1 < retries:
+            heapq.heappush(tries, (when + ADMIT_TIME + rng.uniform(0, wait), first, length, attempt + 1))
+        else:
+            deferred += 1
+            if hold:
+                connections.append((first, when + ADMIT_TIME))
+
+    return writes, connections, deferred
+
+
+def parse_options():
+    parser = OptionParser()
+    parser.add_option("-n", "--hosts", type="int", action="store", dest="hosts", default=5000,
+                      help="Number of simulated hosts")
+    parser.add_option("-i", "--interval", type="int", action="store", dest="interval", default=300,
+                      help="Cron interval in seconds, used as the splay window")
+    parser.add_option("--slots", type="int", action="store", dest="slots", default=25,
+                      help="Admission slots for the admission-limited scenario")
+    parser.add_option("--seed", type="int", action="store", dest="seed", default=1,
+                      help="Random seed for probe and write times")
+
+    (options, args) = parser.parse_args()
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+    fleet = make_fleet(options.hosts, options.seed)
+
+    herd = connections(fleet, 0)
+    splayed = connections(fleet, options.interval)
+    wait, retries = config.admission_wait, config.admission_retries
+    slots = "{0} admission slots".format(options.slots)
+
+    scenarios = [
+        ("no splay", herd, herd, 0),
+        ("splay", splayed, splayed, 0),
+        ("no splay, {0}, held while waiting".format(slots),)
+        + admit(herd, options.slots, wait, retries, options.seed, hold=True),
+        ("no splay, {0}".format(slots),) + admit(herd, options.slots, wait, retries, options.seed),
+        ("splay, {0}".format(slots),) + admit(splayed, options.slots, wait, retries, options.seed),
+    ]
+
+    print("hosts: {0}, interval: {1}s, admission wait {2}s x {3} tries".format(
+        options.hosts, options.interval, wait, retries))
+    print("{0:<48} {1:>11} {2:>11} {3:>14}".format(
+        "scenario", "peak conns", "peak writes", "deferred"))
+    flagged = False
+    for label, writes, conns, deferred in scenarios:
+        note = ''
+        if deferred:
+            note = "{0} ({1:.0f}%) !".format(deferred, 100.0 * deferred / options.hosts)
+            flagged = True
+        print("{0:<48} {1:>11} {2:>11} {3:>14}".format(
+            label, peak_concurrency(conns), peak_concurrency(writes), note or 0))
+    if flagged:
+        print("! deferred hosts spooled their report until a later run; "
+              "add --slots or splay the fleet")
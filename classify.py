@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import functools
+import re
+
+# Rule-based name classifier used for GPU and CPU microarchitectures and
+# tablet models. Rules are (pattern, label) pairs in priority order: when
+# several patterns match a name, the earliest rule wins regardless of where
+# in the name it matched. All rules are compiled into one regex, and results
+# are memoised per name, so classifying a fleet's worth of names costs one
+# match per distinct name.
+
+
+class Classifier:
+    def __init__(self, rules, flags=0, cache_size=4096):
+        self.rules = list(rules)
+        self.labels = [label for pattern, label in self.rules]
+
+        # Anchoring every alternative at the start makes the regex engine
+        # try the rules in order before moving along the name, which is what
+        # gives the earlier rules priority.
+        alternatives = ['.*?(?P<r{0}>{1})'.format(index, pattern)
+                        for index, (pattern, label) in enumerate(self.rules)]
+        self.regex = re.compile('^(?:{0})'.format('|'.join(alternatives) or '(?!)'),
+                                flags | re.DOTALL)
+
+        self.classify = functools.lru_cache(maxsize=cache_size)(self._classify)
+
+    # Label for one name, or '' if no rule matches.
+    def _classify(self, name):
+        if isinstance(name, bytes):
+            name = name.decode("utf-8", "replace")
+
+        match = self.regex.match(name)
+        if match is None:
+            return ''
+
+        return self.labels[int(match.lastgroup[1:])]
+
+    # Labels for several names, one per name in the same order.
+    def classify_all(self, names):
+        return [self.classify(name) for name in names]
+
+
+# Rules that match the keys of a lookup table such as config.linux_tablet_dict
+# as whole hex ids, so '00B1' matches '056a:00b1' or 'PID_00B1' but not '000B1'.
+def table_rules(table):
+    return [('(?<![0-9A-Fa-f]){0}(?![0-9A-Fa-f])'.format(re.escape(key.split('_')[-1])), label)
+            for key, label in table.items()]
+
+
+_classifiers = {}
+
+
+# Shared classifier for a rule list from config. Classifiers are built on
+# first use and rebuilt if config is reloaded with new rules.
+def classifier(rules, flags=0):
+    key = (id(rules), flags)
+    entry = _classifiers.get(key)
+    if entry is None or entry[0] is not rules:
+        if isinstance(rules, dict):
+            compiled = Classifier(table_rules(rules), flags)
+        else:
+            compiled = Classifier(rules, flags)
+        entry = _classifiers[key] = (rules, compiled)
+
+    return entry[1]
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+import csv
+import io
+import json
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from optparse import OptionParser
+
+from psycopg2 import connect
+
+import config
+
+# Reports that carry a fingerprint also get a row in system_check_history.
+HISTORY_SQL = (
+    "insert into system_check_history (name, recorded, fingerprint, report)"
+    " select name, coalesce((report->>'lastupdate')::timestamp, now()),"
+    " report->>'fingerprint', report - 'fingerprint'"
+    " from system_check_staging where report ? 'fingerprint'")
+
+# Central ingest point for agent reports. Agents POST their report (or delta)
+# as JSON, the collector coalesces pending reports per host and flushes them
+# in batches: one COPY into a staging table, then one statement that merges
+# the batch into system_check. When the database falls behind and too many
+# hosts are waiting, new reports are refused with 503 and a Retry-After.
+# GET /stats returns the counters below, which loadgen.py reads.
+class Collector:
+    def __init__(self, db_info, max_pending=None, batch_size=None, flush_interval=None):
+        self.db_info = db_info
+        self.max_pending = max_pending or config.collector_max_pending
+        self.batch_size = batch_size or config.collector_batch_size
+        self.flush_interval = flush_interval or config.collector_flush_interval
+        self.pending = {}
+        self.cond = threading.Condition()
+        self.dbh = None
+        self.columns = None
+        self.running = False
+        self.thread = None
+        # Reports accepted and refused, rows merged into system_check, and
+        # batches flushed.
+        self.accepted = 0
+        self.refused = 0
+        self.merged = 0
+        self.flushes = 0
+
+    # Queue a report. Later reports for the same host are merged over earlier
+    # ones, so a delta never hides columns still waiting to be written.
+    # Returns False when the queue is full and the agent should back off.
+    def submit(self, report):
+        name = report.get('name')
+        if not name:
+            raise ValueError("report has no name")
+
+        with self.cond:
+            if name not in self.pending and len(self.pending) >= self.max_pending:
+                self.refused += 1
+                return False
+            self.accepted += 1
+            self.pending.setdefault(name, {}).update(report)
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+        return True
+
+    # Take up to batch_size hosts off the queue.
+    def take(self):
+        with self.cond:
+            names = list(self.pending)[:self.batch_size]
+            return dict((name, self.pending.pop(name)) for name in names)
+
+    # Put a batch that failed to flush back, without overwriting anything
+    # newer that arrived in the meantime.
+    def requeue(self, batch):
+        with self.cond:
+            for name, report in batch.items():
+                newer = self.pending.get(name, {})
+                report.update(newer)
+                self.pending[name] = report
+
+    def sql_connect(self):
+        if self.dbh is not None and not self.dbh.closed:
+            return
+
+        self.dbh = connect("{0}".format(self.db_info), client_encoding='UTF8')
+        cursor = self.dbh.cursor()
+        cursor.execute(
+            "select column_name from information_schema.columns"
+            " where table_name = 'system_check' order by ordinal_position")
+        self.columns = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "create temp table if not exists system_check_staging (name text, report jsonb)")
+        self.dbh.commit()
+
+    # Build the statement that merges the staging table into system_check.
+    # Only columns present in a host's report are touched; hosts without a
+    # row yet are inserted.
+    def merge_sql(self):
+        columns = [column for column in self.columns if column != 'name']
+        sets = ', '.join(
+            "{0} = case when i.report ? '{0}' then i.{0} else sc.{0} end".format(column)
+            for column in columns)
+        names = ', '.join(self.columns)
+
+        return (
+            "with incoming as ("
+            " select s.report, r.* from system_check_staging s"
+            " cross join lateral jsonb_populate_record(null::system_check, s.report) r"
+            "), updated as ("
+            " update system_check sc set {0} from incoming i"
+            " where sc.name = i.name returning sc.name"
+            ") insert into system_check ({1})"
+            " select {1} from incoming"
+            " where name not in (select name from updated)"
+            " on conflict (name) do nothing").format(sets, names)
+
+    # Write one batch in a single transaction.
+    def flush(self, batch):
+        self.sql_connect()
+        known = set(self.columns)
+
+        data = io.StringIO()
+        writer = csv.writer(data)
+        for name, report in batch.items():
+            report = dict((k, v) for k, v in report.items() if k in known or k == 'fingerprint')
+            writer.writerow([name, json.dumps(report)])
+        data.seek(0)
+
+        cursor = self.dbh.cursor()
+        try:
+            cursor.copy_expert(
+                "copy system_check_staging (name, report) from stdin with (format csv)", data)
+            cursor.execute(self.merge_sql())
+            cursor.execute(HISTORY_SQL)
+            cursor.execute("truncate system_check_staging")
+            self.dbh.commit()
+        except Exception:
+            self.dbh.rollback()
+            raise
+
+        with self.cond:
+            self.merged += len(batch)
+            self.flushes += 1
+
+    # Counters for GET /stats. Accepted reports for a host still pending are
+    # coalesced, so merged rows can trail accepted reports by a lot.
+    def stats(self):
+        with self.cond:
+            return {
+                'accepted': self.accepted,
+                'refused': self.refused,
+                'merged': self.merged,
+                'flushes': self.flushes,
+                'pending': len(self.pending),
+            }
+
+    def flush_loop(self):
+        backoff = 0
+        while self.running:
+            with self.cond:
+                if len(self.pending) < self.batch_size:
+                    self.cond.wait(self.flush_interval)
+
+            batch = self.take()
+            if not batch:
+                continue
+
+            try:
+                self.flush(batch)
+                backoff = 0
+            except Exception as e:
+                print("Failed to flush {0} reports.".format(len(batch)))
+                print(e)
+                self.requeue(batch)
+                if self.dbh is not None:
+                    self.dbh.close()
+                backoff = min(backoff * 2 or 1, config.collector_max_backoff)
+                # stop() cuts the wait short.
+                with self.cond:
+                    if self.running:
+                        self.cond.wait(backoff)
+
+    # How long a refused agent should wait before trying again.
+    def retry_after(self):
+        return int(self.flush_interval) + 1
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.flush_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self.thread
+
+    # Stop the flush thread and wait for it, so a batch it has already taken
+    # is written before this returns.
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # Flush everything still pending. Call it after stop(), so this thread is
+    # the only one using the connection.
+    def drain(self):
+        batch = self.take()
+        while batch:
+            self.flush(batch)
+            batch = self.take()
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    def reply(self, code, body, headers=None):
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        collector = self.server.collector
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            report = json.loads(self.rfile.read(length).decode("utf-8"))
+            accepted = collector.submit(report)
+        except (ValueError, AttributeError) as e:
+            self.reply(400, {'error': str(e)})
+            return
+
+        if accepted:
+            self.reply(202, {'status': 'queued'})
+        else:
+            self.reply(503, {'status': 'busy'},
+                       {'Retry-After': str(collector.retry_after())})
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.reply(200, self.server.collector.stats())
+        else:
+            self.reply(404, {'error': 'not found'})
+
+    # Keep the per-request log quiet; the fleet posts constantly.
+    def log_message(self, format, *args):
+        pass
+
+
+# Service managers stop the collector with SIGTERM; treat it like Ctrl-C, so
+# the pending reports are still drained.
+def on_term(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(collector, address):
+    server = ThreadingHTTPServer(address, CollectorHandler)
+    server.daemon_threads = True
+    server.collector = collector
+
+    return server
+
+
+def parse_options():
+    parser = OptionParser()
+    parser.add_option("-l", "--location", action="store", dest="location", default="home",
+                      help="Database from config.sql_dict to write to")
+    parser.add_option("-b", "--bind", action="store", dest="bind",
+                      default=config.collector_bind[0], help="Address to listen on")
+    parser.add_option("-p", "--port", type="int", action="store", dest="port",
+                      default=config.collector_bind[1], help="Port to listen on")
+
+    (options, args) = parser.parse_args()
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+
+    if options.location not in config.sql_dict:
+        print("Location not found.")
+        sys.exit(1)
+
+    collector = Collector(config.sql_dict[options.location])
+    collector.start()
+    server = serve(collector, (options.bind, options.port))
+    signal.signal(signal.SIGTERM, on_term)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.stop()
+        collector.drain()
@@ -1,10 +1,124 @@
 #!/usr/bin/env python
 
+import os
+
 # SQL database logins
 sql_dict = {
     "home": "dbname='system_check' user='system_check' host='localhost' password='syscheck'"
 }
 
+# Hardware history. Besides hardware fingerprint changes, a history row is
+# written when any of history_fields changes (adding 'uptime' would record
+# every run). syscheckdb.py --maintain keeps partitions history_months_ahead
+# ahead and drops those older than history_retention_months; --history reads
+# the last history_window_days unless --since is given.
+history_fields = ['lastos', 'ipaddr', 'lastuser']
+history_months_ahead = 2
+history_retention_months = 24
+history_window_days = 365
+
+# Rows syscheckdb.py fetches per round trip from its server-side cursor.
+syscheckdb_fetch_size = 500
+
+# Central collector (collector.py). When collector_url is set, agents POST
+# their reports there instead of connecting to the database themselves.
+collector_url = None
+collector_timeout = 10
+collector_bind = ('0.0.0.0', 8642)
+# Hosts allowed to wait for a flush before new reports are refused (503).
+collector_max_pending = 5000
+collector_batch_size = 500
+collector_flush_interval = 2
+collector_max_backoff = 60
+
+# Probe engine settings. Probes run concurrently on probe_workers threads and
+# each one gets probe_timeout seconds before its fallback value is reported.
+probe_workers = 8
+probe_timeout = 10
+# Seconds a killed command gets to release its output before it is abandoned.
+reap_timeout = 1
+
+# With --async, probes that run commands are coroutines on one event loop and
+# only the rest (file reads) use threads, async_probe_workers of them.
+async_probe_workers = 2
+
+# nvidia-smi to query for GPU inventory. Point this at a stub script to test
+# on a machine without a GPU.
+nvidia_smi = 'nvidia-smi'
+
+# Per-probe and per-round-trip timings from the last run (metrics.py). Set
+# metrics_textfile to a path in node_exporter's textfile collector directory
+# to publish them, e.g. '/var/lib/node_exporter/textfile/system_check.prom',
+# and metrics_table to also write them to system_check_metrics.
+metrics_textfile = None
+metrics_table = False
+
+# How far back from the end of Xorg.0.log to look for monitor serials when
+# the kernel doesn't expose EDID.
+xorg_log_scan_bytes = 4 * 1024 * 1024
+
+# Logins reported in recentlogins, newest first, and the most wtmp records
+# scanned looking for them on hosts nobody logs into.
+recent_logins = 10
+wtmp_scan_records = 100000
+
+# Where probes look for host files and commands. host_root is prepended to
+# paths under /proc, /sys and /var/log, and when command_dir is set every
+# command is run from there by its basename. bench_probes.py points both at a
+# recorded fixture; leave them alone on real hosts.
+host_root = '/'
+command_dir = None
+
+# Where the agent keeps local state between runs, such as the last report it
+# pushed to the database. The agent creates it 0700 and refuses to use it if
+# it belongs to another user or group or other can write to it, so it must
+# not be somewhere shared such as /tmp.
+if os.name == 'nt':
+    state_dir = os.path.join(os.environ.get('ProgramData') or 'C:\\ProgramData', 'system_check')
+else:
+    state_dir = '/var/lib/system_check'
+
+# Spread each host's start over this many seconds (system_check.py --splay).
+# Set it to the cron interval; 0 starts immediately.
+splay_interval = 0
+
+# Write admission. At most admission_slots agents write to a database at
+# once (0 disables the limit). A refused agent disconnects, waits up to
+# admission_wait seconds and tries again, admission_retries tries in all,
+# before spooling its report.
+admission_slots = 0
+admission_wait = 5
+admission_retries = 3
+
+# Offline spool for reports that couldn't be written. Retries back off from
+# spool_base_backoff up to spool_max_backoff seconds, with full jitter.
+spool_max_entries = 64
+spool_base_backoff = 60
+spool_max_backoff = 3600
+
+# Probe result cache, kept in state_dir and scoped to the current boot.
+# probe_ttls gives each TTL class a lifetime in seconds; None lasts until the
+# next reboot and 0 is never cached.
+probe_ttls = {'boot': None, 'hourly': 3600, 'fresh': 0}
+probe_cache_entries = 256
+
+# Daemon mode (system_check.py --daemon). Seconds between runs of each probe;
+# probes not listed run once when the daemon starts, i.e. once per boot. A
+# heartbeat is pushed every daemon_heartbeat seconds even if nothing changed.
+daemon_intervals = {
+    'ipaddr': 60,
+    'uptime': 60,
+    'last_info': 60,
+    'logins': 60,
+    'gpus': 900,
+    'monitors': 900,
+    'tablet': 900,
+    'devices': 900,
+    'ssd': 900,
+    'disks': 900,
+}
+daemon_heartbeat = 300
+
 # Dictionaries for various system IDs
 windows_tablet_dict = {
     'PID_00B1': 'Intuos3 6x18',
@@ -26,25 +140,66 @@ linux_tablet_dict = {
 }
 
 # GPU microarchitectures - pattern matches names and assigns their respective archs.
-gpu_arch_dict = {
-    'Quadro RTX [0-9]*': 'turing',
-    'Quadro GV[0-9]*': 'volta',
-    'Quadro GP[0-9]*': 'pascal',
-    'Quadro P[0-9]{4}': 'pascal',
-    'TITAN Xp': 'pascal',
-    'GTX 10[0-9]{2}': 'pascal',
-    'Quadro M[0-9]{4}': 'maxwell',
-    'GTX TITAN X': 'maxwell',
-    'GTX 9[0-9]{2}': 'maxwell',
-    'Quadro K[0-9]{4}': 'kepler',
-    'GTX TITAN Black': 'kepler',
-    'GTX [6-7][0-9]{2}': 'kepler',
-    'Quadro [0-9]{4}': 'fermi',
-    'GTX [5][0-9]{2}': 'fermi',
-    'Quadro FX [3-9][0-9]{3}': 'tesla',
-    'Quadro FX 770M': 'tesla',
-    'Quadro FX 1500': 'curie',
-    'Tesla V[0-9]{3}': 'volta',
-    'Quadro RTX A[0-9]{4}': 'ampere',
-    'GeForce RTX 20[0-9]{2}': 'turing',
-}
+# Rules are checked in order and the first match wins, so more specific
+# patterns have to come before the broader ones they overlap with.
+gpu_arch_rules = [
+    ('Quadro RTX A[0-9]{4}', 'ampere'),
+    ('RTX A[0-9]{4}', 'ampere'),
+    ('NVIDIA A[0-9]{1,3}([^0-9]|$)', 'ampere'),
+    ('GeForce RTX 30[0-9]{2}', 'ampere'),
+    ('Quadro RTX [0-9]*', 'turing'),
+    ('GeForce RTX 20[0-9]{2}', 'turing'),
+    ('Tesla T4', 'turing'),
+    ('Quadro GV[0-9]*', 'volta'),
+    ('Tesla V[0-9]{3}', 'volta'),
+    ('Quadro GP[0-9]*', 'pascal'),
+    ('Quadro P[0-9]{4}', 'pascal'),
+    ('TITAN Xp', 'pascal'),
+    ('GTX 10[0-9]{2}', 'pascal'),
+    ('Quadro M[0-9]{4}', 'maxwell'),
+    ('GTX TITAN X', 'maxwell'),
+    ('GTX 9[0-9]{2}', 'maxwell'),
+    ('Quadro K[0-9]{4}', 'kepler'),
+    ('GTX TITAN Black', 'kepler'),
+    ('GTX [6-7][0-9]{2}', 'kepler'),
+    ('Quadro FX 1500', 'curie'),
+    ('Quadro FX 770M', 'tesla'),
+    ('Quadro FX [3-9][0-9]{3}', 'tesla'),
+    ('Quadro [0-9]{4}', 'fermi'),
+    ('GTX [5][0-9]{2}', 'fermi'),
+]
+
+# CPU microarchitectures from the model name, first match wins as above.
+cpu_arch_rules = [
+    ('Xeon\\(R\\) (Platinum|Gold|Silver|Bronze) [0-9]3[0-9]{2}', 'icelake'),
+    ('Xeon\\(R\\) (Platinum|Gold|Silver|Bronze) [0-9]2[0-9]{2}', 'cascadelake'),
+    ('Xeon\\(R\\) (Platinum|Gold|Silver|Bronze) [0-9]1[0-9]{2}', 'skylake'),
+    ('Xeon\\(R\\) W-22[0-9]{2}', 'cascadelake'),
+    ('Xeon\\(R\\) W-21[0-9]{2}', 'skylake'),
+    ('E[57]-[0-9]{4}[A-Z]* v4', 'broadwell'),
+    ('E[357]-[0-9]{4}[A-Z]* v3', 'haswell'),
+    ('E[357]-[0-9]{4}[A-Z]* v2', 'ivybridge'),
+    ('E[357]-[0-9]{4}', 'sandybridge'),
+    ('X5[0-9]{3}', 'westmere'),
+    ('i[3579]-12[0-9]{3}', 'alderlake'),
+    ('i[3579]-11[0-9]{3}', 'rocketlake'),
+    ('i[3579]-10[0-9]{3}', 'cometlake'),
+    ('i[3579]-[89][0-9]{3}', 'coffeelake'),
+    ('i[3579]-7[0-9]{3}', 'kabylake'),
+    ('i[3579]-6[0-9]{3}', 'skylake'),
+    ('i[3579]-5[0-9]{3}', 'broadwell'),
+    ('i[3579]-4[0-9]{3}', 'haswell'),
+    ('i[3579]-3[0-9]{3}', 'ivybridge'),
+    ('i[3579]-2[0-9]{3}', 'sandybridge'),
+    ('Threadripper PRO 5[0-9]{3}', 'zen3'),
+    ('Threadripper (PRO )?3[0-9]{3}', 'zen2'),
+    ('Threadripper 2[0-9]{3}', 'zen+'),
+    ('Threadripper 1[0-9]{3}', 'zen'),
+    ('EPYC 7[0-9]{2}3', 'zen3'),
+    ('EPYC 7[0-9]{2}2', 'zen2'),
+    ('EPYC 7[0-9]{2}1', 'zen'),
+    ('Ryzen [3579] 5[0-9]{3}', 'zen3'),
+    ('Ryzen [3579] 3[0-9]{3}', 'zen2'),
+    ('Ryzen [3579] 2[0-9]{3}', 'zen+'),
+    ('Ryzen [3579] 1[0-9]{3}', 'zen'),
+]
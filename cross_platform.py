@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 
-import re
 import platform
 import socket
 import time
-from subprocess import Popen, PIPE, CalledProcessError
-from uuid import getnode as get_mac
+from subprocess import STDOUT
 
 import config
+from classify import classifier
+from probe_runner import run_cmd
+
+# Fields requested from nvidia-smi, and the record keys they map to.
+GPU_QUERY_FIELDS = ['name', 'serial', 'memory.total', 'uuid', 'pci.bus_id', 'driver_version']
+GPU_RECORD_KEYS = ['name', 'serial', 'memory', 'uuid', 'pci_bus_id', 'driver_version']
 
 # Base class for tasks that can be accomplished on both Linux and Windows.
 class CrossPlatform:
@@ -19,6 +23,20 @@ class CrossPlatform:
 
         return name
 
+    # Seconds to wait before running so hosts on the same schedule spread
+    # across the interval. Derived from a hash of the hostname, so it's
+    # stable per host and uniform across the fleet.
+    def get_splay(self, interval, name=None):
+        if not interval:
+            return 0
+
+        import hashlib
+
+        name = name or self.get_name()
+        digest = int(hashlib.sha1(name.encode("utf-8")).hexdigest(), 16)
+
+        return (digest % (int(interval) * 1000)) / 1000.0
+
     def get_os(self):
         sysos = platform.system().lower()
 
@@ -46,17 +64,16 @@ class CrossPlatform:
         else:
             return "unknown"
 
-    # Get the IPv4 address.
+    # Get the IPv4 address. Raises if the hostname doesn't resolve.
     def get_ip(self):
-        try:
-            ipaddr = socket.gethostbyname(socket.gethostname())
-            return ipaddr
-        except:
-            ipaddr = '0.0.0.0'
-            return ipaddr
+        ipaddr = socket.gethostbyname(socket.gethostname())
+
+        return ipaddr
 
     # Get the MAC address.
     def get_mac(self):
+        from uuid import getnode as get_mac
+
         macaddr = ':'.join(("%012X" % get_mac())[i:i + 2] for i in range(0, 12, 2))
 
         return macaddr
@@ -67,109 +84,113 @@ class CrossPlatform:
 
         return lastupdate
 
-    # Get NVIDIA GPU information.
-    def get_gpu(self, smi):
-        try:
-            cmdgpu = [smi, '-L']
-            rungpu = Popen(cmdgpu, stdout=PIPE)
-            gpu = rungpu.communicate()[0].strip()
-            gpu = re.sub(r'\([^)]*\)', '', gpu)
-            gpu = re.sub(r'GPU.+: ', '', gpu).strip()
-            gpu = gpu.replace('\r', '')
-            if '\n' in gpu:
-                gpu = gpu.replace(' \n', ',')
-            if 'NVIDIA-SMI' in gpu:
-                gpu = ''
-            if 'Failed' in gpu:
-                gpu = ''
-            if 'Unable' in gpu:
-                gpu = ''
-        except BaseException:
+    # Get every NVIDIA GPU in one nvidia-smi call. Each record carries the
+    # name, serial, memory (MiB), UUID, PCI bus id and driver version. A
+    # missing or failing nvidia-smi raises, so the probe reports its fallback
+    # as an error rather than as a host with no GPUs.
+    def get_gpu_inventory(self, smi):
+        out = run_cmd(self.gpu_inventory_cmd(smi), stderr=STDOUT, check=True)
+
+        return self.parse_gpu_inventory(out)
+
+    # get_gpu_inventory as a coroutine, for the asyncio probe runner.
+    async def get_gpu_inventory_async(self, smi):
+        from async_runner import run_cmd_async
+
+        out = await run_cmd_async(self.gpu_inventory_cmd(smi), stderr=STDOUT, check=True)
+
+        return self.parse_gpu_inventory(out)
+
+    def gpu_inventory_cmd(self, smi):
+        return [
+            smi,
+            '--query-gpu=' + ','.join(GPU_QUERY_FIELDS),
+            '--format=csv,noheader,nounits']
+
+    # Parse nvidia-smi CSV output into per-device records. Error text such as
+    # "NVIDIA-SMI has failed" doesn't have the right number of fields and is
+    # skipped, and placeholders like [N/A] come back empty.
+    def parse_gpu_inventory(self, out):
+        import csv
+
+        gpus = []
+        out = out.decode("utf-8", "replace")
+
+        for row in csv.reader(out.splitlines(), skipinitialspace=True):
+            if len(row) != len(GPU_QUERY_FIELDS):
+                continue
+            gpu = {}
+            for key, value in zip(GPU_RECORD_KEYS, row):
+                value = value.strip()
+                if value.startswith('['):
+                    value = ''
+                gpu[key] = value
+            gpus.append(gpu)
+
+        return gpus
+
+    # Get GPU names. Without nvidia-smi, Windows can still name the cards.
+    def get_gpu(self, gpus):
+        if gpus:
+            return ','.join(gpu['name'] for gpu in gpus)
+
+        gpu = ''
+        if self.get_os() == 'windows':
             try:
-                gpu = ''
                 cmdgpu = [
                     'powershell',
                     '(Get-WMIObject Win32_VideoController).Name |  Where-Object {$_ -notmatch "Remote"}']
-                rungpu = Popen(cmdgpu, stdout=PIPE)
-                gpu = rungpu.communicate()[0].strip(b'\r\n')
+                gpu = run_cmd(cmdgpu).strip(b'\r\n')
                 gpu = gpu.decode("utf-8")
+                gpu = gpu.replace('\r', '')
                 if '\n' in gpu:
-                    gpu = gpu.replace(' \n', ',')
+                    gpu = gpu.replace(' \n', ',').replace('\n', ',')
             except BaseException:
                 gpu = ''
 
         return gpu
 
-    # Get the Serial number of the NVIDIA GPU.
-    def get_gpu_serial(self, smi):
-        try:
-            cmdgpuserial = [smi, '--query-gpu=serial', '--format=csv,noheader']
-            rungpuserial = Popen(
-                cmdgpuserial,
-                stdout=PIPE,
-                stderr=subprocess.STDOUT)
-            gpuserial = rungpuserial.communicate()[0].strip()
-            gpuserial = gpuserial.replace('\r', '')
-            if '\n' in gpuserial:
-                gpuserial = gpuserial.replace('\n', ',')
-            if 'NVIDIA-SMI' in gpuserial:
-                gpuserial = ''
-            if 'Invalid' in gpuserial:
-                gpuserial = ''
-            if 'Failed' in gpuserial:
-                gpuserial = ''
-            if 'Unable' in gpuserial:
-                gpuserial = ''
-            if 'Not Supported' in gpuserial:
-                gpuserial = ''
-        except BaseException:
-            gpuserial = ''
+    # Get the Serial number of each NVIDIA GPU, one entry per device so the
+    # list lines up with the gpu column. Boards that don't report one are
+    # left blank.
+    def get_gpu_serial(self, gpus):
+        serials = [gpu['serial'] for gpu in gpus]
+        if not any(serials):
+            return ''
 
-        return gpuserial
+        return ','.join(serials)
 
-    # Get the amount of VRAM on the NVIDIA GPU.
-    def get_gpu_ram(self, smi):
-        try:
-            cmdgpuram = [
-            	smi,
-            	'--query-gpu=memory.total',
-            	'--format=csv,noheader']
-            rungpuram = Popen(cmdgpuram, stdout=PIPE)
-            gpuram = rungpuram.communicate()[0].strip()
-            gpuram = gpuram.decode("utf-8")
-            gpuram = re.sub("[^0-9\n]", "", gpuram)
-            if '\n' in gpuram:
-                gpuram = gpuram.replace('\n', ',')
-            if 'NVIDIA-SMI' in gpuram:
-                gpuram = ''
-            if 'Invalid' in gpuram:
-                gpuram = ''
-            if 'Failed' in gpuram:
-                gpuram = ''
-            if 'Unable' in gpuram:
-                gpuram = ''
-        except BaseException:
-            gpuram = ''
+    # Get the amount of VRAM on each NVIDIA GPU, lined up with the gpu column
+    # the same way.
+    def get_gpu_ram(self, gpus):
+        memory = [gpu['memory'] for gpu in gpus]
+        if not any(memory):
+            return ''
 
-        return gpuram
+        return ','.join(memory)
+
+    # The first two monitor records as the monitor1/serial1/monitor2/serial2
+    # columns.
+    def get_monitor_columns(self, monitors):
+        monitors = list(monitors[:2]) + [{}] * (2 - len(monitors[:2]))
+
+        return (monitors[0].get('model', ''), monitors[0].get('serial', ''),
+                monitors[1].get('model', ''), monitors[1].get('serial', ''))
+
+    # Get the microarchitecture of each GPU name, one entry per device so the
+    # list lines up with the gpu column. Unrecognised cards are left blank.
+    def get_gpu_arch(self, names):
+        archs = classifier(config.gpu_arch_rules).classify_all(
+            name.strip() for name in names if name.strip())
+        if not any(archs):
+            return ''
+
+        return ','.join(archs)
+
+    # Get the microarchitecture of the CPU from its model name.
+    def get_cpu_arch(self, cpuname):
+        return classifier(config.cpu_arch_rules).classify(cpuname)
 
-    # Get the microarchitecture of the NVIDIA GPU.
-    # These values are embedded in config.
-    def get_gpu_arch(self, gpu):
-        gpuarch = ''
-        try:
-            if ',' in gpu:
-                gpuarch = []
-                for x in gpu.split(b','):
-                    for k in list(config.gpu_arch_dict.keys()):
-                        if re.search(k, gpu):
-                            gpuarch.append(config.gpu_arch_dict[k])
-                gpuarch = ','.join(gpuarch)
-            else:
-                for k in list(config.gpu_arch_dict.keys()):
-                    if re.search(k, gpu):
-                        gpuarch = config.gpu_arch_dict[k]
-        except BaseException:
-            gpuarch = ''
 
-        return gpuarch
+# Shared instance for modules that need cross platform probes.
+CP = CrossPlatform()
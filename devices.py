@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import os
+
+from sysfs import read_text, Snapshot
+
+# PCI and USB device inventory from sysfs. One walk over /sys/bus/pci/devices
+# and /sys/bus/usb/devices reads each device's class and vendor/product ids
+# into an in-memory index, which answers the NVMe and tablet checks and
+# provides the devices column, without running lspci or lsusb.
+
+PCI_PATH = '/sys/bus/pci/devices'
+USB_PATH = '/sys/bus/usb/devices'
+
+# PCI class/subclass of a non-volatile memory (NVMe) controller.
+PCI_CLASS_NVME = '0108'
+
+USB_VENDOR_WACOM = '056a'
+
+# How long one walk is reused: long enough for every probe in a run to share
+# it, short enough that the daemon sees devices plugged in since.
+SNAPSHOT_AGE = 10
+
+_snapshot = Snapshot(SNAPSHOT_AGE)
+
+
+# A sysfs hex id such as "0x10de" as "10de".
+def hex_id(text):
+    text = text.lower()
+
+    return text[2:] if text.startswith('0x') else text
+
+
+class DeviceIndex:
+    def __init__(self, pci_path=PCI_PATH, usb_path=USB_PATH):
+        self.devices = self.read_pci(pci_path) + self.read_usb(usb_path)
+        self.by_bus = {}
+        for device in self.devices:
+            self.by_bus.setdefault(device['bus'], []).append(device)
+
+    def read_pci(self, pci_path):
+        try:
+            addresses = sorted(os.listdir(pci_path))
+        except OSError:
+            return []
+
+        devices = []
+        for address in addresses:
+            path = os.path.join(pci_path, address)
+            devices.append({
+                'bus': 'pci',
+                'address': address,
+                'class': hex_id(read_text(os.path.join(path, 'class'))),
+                'vendor': hex_id(read_text(os.path.join(path, 'vendor'))),
+                'product': hex_id(read_text(os.path.join(path, 'device'))),
+            })
+
+        return devices
+
+    # USB devices, not their interfaces (the "1-1:1.0" entries), which have
+    # no ids of their own. Manufacturer and product strings are included
+    # when the device reports them.
+    def read_usb(self, usb_path):
+        try:
+            names = sorted(name for name in os.listdir(usb_path) if ':' not in name)
+        except OSError:
+            return []
+
+        devices = []
+        for name in names:
+            path = os.path.join(usb_path, name)
+            vendor = read_text(os.path.join(path, 'idVendor'))
+            if not vendor:
+                continue
+            devices.append({
+                'bus': 'usb',
+                'address': name,
+                'class': read_text(os.path.join(path, 'bDeviceClass')),
+                'vendor': hex_id(vendor),
+                'product': hex_id(read_text(os.path.join(path, 'idProduct'))),
+                'manufacturer': read_text(os.path.join(path, 'manufacturer')),
+                'name': read_text(os.path.join(path, 'product')),
+            })
+
+        return devices
+
+    # Devices on bus matching the given ids. device_class matches as a
+    # prefix, so '0108' finds any NVMe controller whatever its interface.
+    def find(self, bus, vendor=None, product=None, device_class=None):
+        return [device for device in self.by_bus.get(bus, [])
+                if (vendor is None or device['vendor'] == vendor)
+                and (product is None or device['product'] == product)
+                and (device_class is None or device['class'].startswith(device_class))]
+
+
+# The device index for this run, walked again once it is SNAPSHOT_AGE old.
+def snapshot(pci_path=PCI_PATH, usb_path=USB_PATH):
+    return _snapshot.get(DeviceIndex, pci_path, usb_path)
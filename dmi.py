@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import os
+import struct
+
+from sysfs import host_path, Snapshot
+
+# SMBIOS structure types we decode.
+DMI_SYSTEM = 1
+DMI_BASEBOARD = 2
+DMI_MEMORY_DEVICE = 17
+DMI_END_OF_TABLE = 127
+
+DMI_ID_PATH = '/sys/class/dmi/id'
+DMI_TABLE_PATH = '/sys/firmware/dmi/tables/DMI'
+
+_snapshot = Snapshot()
+
+
+# One pass over the SMBIOS table, decoded in-process. Replaces separate
+# dmidecode runs for the system, baseboard and memory device sections.
+class DmiSnapshot:
+    def __init__(self, id_path=DMI_ID_PATH, table_path=DMI_TABLE_PATH):
+        self.ids = self.read_ids(id_path)
+        self.system = {}
+        self.baseboard = {}
+        self.memory = []
+
+        try:
+            with open(table_path, 'rb') as data:
+                table = data.read()
+        except (IOError, OSError):
+            table = b''
+
+        for dtype, formatted, strings in self.structures(table):
+            if dtype == DMI_SYSTEM:
+                self.system = self.decode_system(formatted, strings)
+            elif dtype == DMI_BASEBOARD:
+                self.baseboard = self.decode_baseboard(formatted, strings)
+            elif dtype == DMI_MEMORY_DEVICE:
+                self.memory.append(self.decode_memory(formatted, strings))
+
+    # The /sys/class/dmi/id attributes the kernel already decoded for us.
+    # Serial numbers are root-only, so unreadable files are skipped.
+    def read_ids(self, id_path):
+        ids = {}
+        try:
+            names = os.listdir(id_path)
+        except OSError:
+            return ids
+
+        for name in names:
+            try:
+                with open(os.path.join(id_path, name), 'r') as data:
+                    ids[name] = data.read().strip()
+            except (IOError, OSError, UnicodeDecodeError):
+                pass
+
+        return ids
+
+    # Walk the raw table and yield (type, formatted area, strings) for each
+    # structure. The string set follows the formatted area and ends with a
+    # double NUL.
+    def structures(self, table):
+        offset = 0
+        while offset + 4 <= len(table):
+            dtype, length = struct.unpack_from('<BB', table, offset)
+            if length < 4:
+                break
+            formatted = table[offset:offset + length]
+            end = table.find(b'\x00\x00', offset + length)
+            if end < 0:
+                break
+            strings = [s.decode('utf-8', 'replace').strip()
+                       for s in table[offset + length:end].split(b'\x00')]
+            yield dtype, formatted, strings
+            if dtype == DMI_END_OF_TABLE:
+                break
+            offset = end + 2
+
+    def string(self, formatted, offset, strings):
+        if offset >= len(formatted):
+            return ''
+        index = formatted[offset]
+        if index == 0 or index > len(strings):
+            return ''
+        return strings[index - 1]
+
+    def word(self, formatted, offset):
+        if offset + 2 > len(formatted):
+            return None
+        return struct.unpack_from('<H', formatted, offset)[0]
+
+    def dword(self, formatted, offset):
+        if offset + 4 > len(formatted):
+            return None
+        return struct.unpack_from('<I', formatted, offset)[0]
+
+    def decode_system(self, formatted, strings):
+        return {
+            'manufacturer': self.string(formatted, 0x04, strings),
+            'product': self.string(formatted, 0x05, strings),
+            'serial': self.string(formatted, 0x07, strings),
+        }
+
+    def decode_baseboard(self, formatted, strings):
+        return {
+            'manufacturer': self.string(formatted, 0x04, strings),
+            'product': self.string(formatted, 0x05, strings),
+            'serial': self.string(formatted, 0x07, strings),
+        }
+
+    # Size is reported in MB (0 for an empty slot). Speeds are in MT/s, with
+    # 0 meaning unknown.
+    def decode_memory(self, formatted, strings):
+        size = self.word(formatted, 0x0C) or 0
+        if size == 0xFFFF:
+            size = 0
+        elif size == 0x7FFF:
+            size = (self.dword(formatted, 0x1C) or 0) & 0x7FFFFFFF
+        elif size & 0x8000:
+            size = (size & 0x7FFF) // 1024
+        speed = self.word(formatted, 0x15) or 0
+        if speed == 0xFFFF:
+            speed = self.dword(formatted, 0x54) or 0
+        configured = self.word(formatted, 0x20) or 0
+        if configured == 0xFFFF:
+            configured = self.dword(formatted, 0x58) or 0
+
+        return {
+            'locator': self.string(formatted, 0x10, strings),
+            'size': size,
+            'speed': speed,
+            'configured_speed': configured,
+            'manufacturer': self.string(formatted, 0x17, strings),
+            'serial': self.string(formatted, 0x18, strings),
+            'part': self.string(formatted, 0x1A, strings),
+        }
+
+    # System serial, falling back to what sysfs already decoded.
+    def system_serial(self):
+        return self.system.get('serial') or self.ids.get('product_serial', '')
+
+    def board_serial(self):
+        return self.baseboard.get('serial') or self.ids.get('board_serial', '')
+
+    # Populated DIMM slots only.
+    def dimms(self):
+        return [dimm for dimm in self.memory if dimm['size']]
+
+
+# The DMI snapshot for this run, decoded on first use. Probes running on
+# different workers share the same parse.
+def snapshot():
+    return _snapshot.get(DmiSnapshot, host_path(DMI_ID_PATH), host_path(DMI_TABLE_PATH))
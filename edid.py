@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import math
+import os
+import re
+import struct
+
+# EDID decoding for the monitor probe. The kernel exposes each connector's
+# EDID under /sys/class/drm/<card>-<connector>/edid, so every attached
+# display can be identified without asking X or the GPU driver.
+
+DRM_PATH = '/sys/class/drm'
+
+EDID_HEADER = b'\x00\xff\xff\xff\xff\xff\xff\x00'
+
+# Display descriptor tags in the four 18-byte descriptor slots.
+DESCRIPTOR_SERIAL = 0xFF
+DESCRIPTOR_NAME = 0xFC
+DESCRIPTOR_OFFSETS = [54, 72, 90, 108]
+
+
+# Text from a display descriptor: up to 13 bytes, ended by a newline and
+# padded with spaces.
+def descriptor_text(raw):
+    return raw.split(b'\n', 1)[0].decode("ascii", "replace").strip()
+
+
+# Decode a base EDID block into a monitor record, or None if blob isn't one.
+def decode(blob):
+    if len(blob) < 128 or blob[:8] != EDID_HEADER:
+        return None
+
+    # The manufacturer id is big-endian, the rest of the header little-endian.
+    vendor, = struct.unpack_from('>H', blob, 8)
+    product, serial, week, year = struct.unpack_from('<HIBB', blob, 10)
+    manufacturer = ''.join(chr(ord('A') - 1 + ((vendor >> shift) & 0x1F)) for shift in (10, 5, 0))
+
+    descriptors = {}
+    for offset in DESCRIPTOR_OFFSETS:
+        block = blob[offset:offset + 18]
+        if block[:2] == b'\x00\x00' and block[3] not in descriptors:
+            descriptors[block[3]] = descriptor_text(block[5:18])
+
+    width, height = blob[21], blob[22]
+    size = round(math.hypot(width, height) / 2.54, 1) if width and height else 0
+
+    return {
+        'manufacturer': manufacturer,
+        'product': '{0:04X}'.format(product),
+        'model': descriptors.get(DESCRIPTOR_NAME)
+                 or '{0} {1:04X}'.format(manufacturer, product),
+        'serial': descriptors.get(DESCRIPTOR_SERIAL) or (str(serial) if serial else ''),
+        'width_cm': width,
+        'height_cm': height,
+        'size_in': size,
+        'year': year + 1990 if year else 0,
+    }
+
+
+# Sort key that puts card0-DP-2 before card0-DP-10.
+def natural(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+# Every connected display with a readable EDID, in connector order. Each
+# record also carries the connector name, e.g. card0-DP-1.
+def monitors(drm_path=DRM_PATH):
+    try:
+        names = sorted(os.listdir(drm_path), key=natural)
+    except OSError:
+        return []
+
+    found = []
+    for name in names:
+        path = os.path.join(drm_path, name)
+        try:
+            with open(os.path.join(path, 'status'), 'r') as data:
+                if data.read().strip() != 'connected':
+                    continue
+            with open(os.path.join(path, 'edid'), 'rb') as data:
+                blob = data.read()
+        except (IOError, OSError):
+            continue
+
+        monitor = decode(blob)
+        if monitor is not None:
+            monitor['connector'] = name
+            found.append(monitor)
+
+    return found
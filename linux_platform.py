@@ -1,30 +1,37 @@
 #!/usr/bin/env python
 
 import os
-import datetime
 import math
 import re
-from subprocess import Popen, PIPE
-from cross_platform import CrossPlatform
+from probe_runner import run_cmd
+from sysfs import host_path
+from classify import classifier
+from cross_platform import CP
+import devices
+import dmi
+import edid
+import storage
+import topology
+import wtmp
 
 import config
 
-CP = CrossPlatform()
 
 # Platform for linux-y ways of getting hardware information.
 class LinuxPlatform:
+    # Get the system serial number from the DMI snapshot.
     def get_mb_serial(self):
-        cmdmbserial = ['/usr/sbin/dmidecode', '-t', 'system']
-        runmbserial = Popen(cmdmbserial, stdout=PIPE)
-        mbserial = [x for x in runmbserial.communicate()[0].split(
-            b'\n') if b'Serial Number' in x][0].split()[-1]
-        mbserial = mbserial.decode("utf-8")
-            
+        mbserial = dmi.snapshot().system_serial()
+
         return mbserial
 
     # Get the machine's location in the ORG based on VLAN.
     def get_location(self):
-        ip_vlan = int(CrossPlatform().get_ip().split('.', 2)[1])
+        try:
+            ipaddr = CP.get_ip()
+        except OSError:
+            ipaddr = '0.0.0.0'
+        ip_vlan = int(ipaddr.split('.', 2)[1])
 
         if ip_vlan == 147:
             location = 'losangeles'
@@ -37,8 +44,13 @@ class LinuxPlatform:
 
         return location
 
-    # Get the machine's location in the ORG based on VLAN.
+    # Get the machine's RAM in GB. Installed DIMMs are summed when the DMI
+    # table is readable, otherwise fall back to what the kernel sees.
     def get_ram(self):
+        dimms = dmi.snapshot().dimms()
+        if dimms:
+            return sum(dimm['size'] for dimm in dimms) // 1024
+
         ram_bytes = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
         # Cast to str to truncate int
         ram = int(ram_bytes / (1024.**2))
@@ -55,200 +67,183 @@ class LinuxPlatform:
 
         return ram
 
-    # Get the RAM's speed.
+    # Get the RAM's speed, with the configured clock speed in brackets when
+    # it differs from the rated speed.
     def get_ram_speed(self):
         ramspeed = ''
-        cmdspeed = ['/usr/sbin/dmidecode', '--type', 'memory']
-        runcmdspeed = Popen(cmdspeed, stdout=PIPE)
-        speeds = runcmdspeed.communicate()[0].split(b'\n')
-        ramspeed = [
-            entry for entry in speeds if b'Speed' in entry and b'Unknown' not in entry \
-            and b'Configured Clock Speed' not in entry][0]
-        ramspeed = ramspeed.lstrip(b'\tSpeed: ')
-
-        if not ramspeed.isdigit():
-            ramspeed = ''
-            
-        # If the clockspeed is configured separately.
-        ccramspeed = [
-            entry for entry in speeds if b'Configured Clock Speed' in entry and b'Unknown' not in entry]
-
-        if ccramspeed:
-            ccramspeed = ccramspeed[0]
-            ccramspeed = ccramspeed.lstrip(b'\tConfigured Clock Speed: ')
-
-        if ccramspeed and ccramspeed != ramspeed:
-            ramspeed = str(ramspeed) + '(' + str(ccramspeed) + ')'
+        dimms = [dimm for dimm in dmi.snapshot().dimms() if dimm['speed']]
+
+        if dimms:
+            ramspeed = str(dimms[0]['speed'])
+            ccramspeed = dimms[0]['configured_speed']
+            if ccramspeed and ccramspeed != dimms[0]['speed']:
+                ramspeed = ramspeed + '(' + str(ccramspeed) + ')'
 
         return ramspeed
 
-    # Get any SSDs the machine may have internally.
+    # Get any SSDs the machine may have internally, as a comma separated
+    # list of serials (or device names where there is no serial). NVMe drives
+    # count; USB drives don't.
     def get_ssd(self):
-        ssd = ''
-        cmddisk = ['lsblk', '-n', '-d', '-o', 'NAME,ROTA', '-I', '8']
-        rundisk = Popen(cmddisk, stdout=PIPE)
-        disks = rundisk.communicate()[0].strip().split(b'\n')
-        cmddiskid = ['ls', '-la', '/dev/disk/by-id', '-I', '.', '-I', '..']
-        rundiskid = Popen(cmddiskid, stdout=PIPE)
-        diskids = rundiskid.communicate()[0].strip().split(b'\n')
-
-        for disk in disks:
-            if b'0' in disk:
-                ssdisk = [diskid.split(b' ->')[0].split(b'_')[-1] for diskid in diskids if disk.split()[
-                    0] in diskid and b'part' not in diskid and b'scsi' not in diskid and b'wwn-' not in diskid]
-                if ssdisk != []:
-                    ssd += ssdisk[0]
-
-        return ssd
-
-    # Get the type of tablet machine is using.
+        return ','.join(disk['serial'] or disk['name'] for disk in self.get_disks()
+                        if not disk['rotational'] and disk['transport'] != 'usb')
+
+    # Every physical disk as a record of name, model, serial, size in bytes,
+    # rotational, removable and transport.
+    def get_disks(self):
+        return storage.snapshot(host_path(storage.BLOCK_PATH), host_path(storage.BY_ID_PATH))
+
+    # Get the type of tablet machine is using: the model for a known Wacom
+    # product id, otherwise the name the tablet reports.
     def get_tablet(self):
-        cmdtablet = ['lsusb', '-d', '056a:']
-        runtablet = Popen(cmdtablet, stdout=PIPE)
-        try:
-            tabletraw = runtablet.communicate()[0]
-            tablet = [entry.split(b', Ltd')[1].split() for entry in tabletraw.split(
-                b'\n') if b'intuos' in entry.lower()][0]
-            tablet = tablet[0] + ' ' + tablet[1]
-        except BaseException:
-            try:
-                pid = tabletraw.split()[5].split(':')[1]
-                tablet = config.linux_tablet_dict[pid]
-            except BaseException:
-                tablet = ''
-
-        return tablet
-
-    # Get monitor info.
-    def get_monitor_info(self):
+        for device in self.get_device_index().find('usb', vendor=devices.USB_VENDOR_WACOM):
+            tablet = classifier(config.linux_tablet_dict, re.IGNORECASE).classify(device['product'])
+            if tablet or device['name']:
+                return tablet or device['name']
+
+        return ''
+
+    # The PCI and USB devices index, shared by the probes of one run.
+    def get_device_index(self):
+        return devices.snapshot(host_path(devices.PCI_PATH), host_path(devices.USB_PATH))
+
+    # Every PCI and USB device with its class and vendor/product ids.
+    def get_devices(self):
+        return self.get_device_index().devices
+
+    # Get every attached monitor from the EDID the kernel exposes for each
+    # DRM connector. Drivers that don't publish EDID there (the NVIDIA
+    # driver without modesetting) fall back to nvidia-xconfig and the Xorg log.
+    def get_monitors(self):
+        monitors = edid.monitors(host_path(edid.DRM_PATH))
+        if monitors:
+            return monitors
+
+        return self.get_xorg_monitors()
+
+    # Monitor names from nvidia-xconfig, paired with the most recent EDID
+    # serials in the Xorg log. No nvidia-xconfig just means no names; one
+    # that fails or hangs fails the probe.
+    def get_xorg_monitors(self):
         try:
-            cmdmon = ['nvidia-xconfig', '--query-gpu-info']
-            runmon = Popen(cmdmon, stdout=PIPE)
-            mons = runmon.communicate()[0].split(b'\n')
-            mon = [mon.split(b':')[1].strip() for mon in mons if b'EDID' in mon]
-        except BaseException:
-            pass
-        try:
-            monitor1 = mon[0]
-        except BaseException:
-            monitor1 = ''
-        try:
-            monitor2 = mon[1]
-        except BaseException:
-            monitor2 = ''
-        try:
-            with open('/var/log/Xorg.0.log', 'r') as data:
-                serialfile = data.readlines()
-            serials = [serial.split(b': ')[2].strip(
-            ) for serial in serialfile if b'Serial Number String' in serial]
-        except BaseException:
-            serials = ''
+            mons = run_cmd(['nvidia-xconfig', '--query-gpu-info'], check=True).split(b'\n')
+        except FileNotFoundError:
+            mons = []
+        names = [mon.split(b':', 1)[1].strip().decode("utf-8", "replace")
+                 for mon in mons if b'EDID' in mon and b':' in mon]
+
+        serials = []
+        for line in self.tail_lines(host_path('/var/log/Xorg.0.log')):
+            if b'Serial Number String' in line:
+                serials.insert(0, line.split(b': ')[-1].strip().decode("utf-8", "replace"))
+                if len(serials) >= max(len(names), 2):
+                    break
+
+        monitors = []
+        for index in range(max(len(names), len(serials))):
+            monitors.append({
+                'model': names[index] if index < len(names) else '',
+                'serial': serials[index] if index < len(serials) else '',
+            })
+
+        return monitors
+
+    # Lines of a file from the last one backwards, read in binary blocks from
+    # the end. Stops after limit bytes, so the cost of reading a long-lived
+    # log doesn't grow with its size.
+    def tail_lines(self, path, block=65536, limit=None):
+        limit = limit or config.xorg_log_scan_bytes
         try:
-            serial1 = serials[-2]
-        except BaseException:
-            serial1 = ''
-        try:
-            serial2 = serials[-1]
-        except BaseException:
-            serial2 = ''
-
-        return monitor1, serial1, monitor2, serial2
-
-    # Get info on the last logged in user.
-    # This function would need to be fine-tuned per OS, and this specific
-    # function has been fine-tuned for CentOS 7.
+            data = open(path, 'rb')
+        except (IOError, OSError):
+            return
+
+        with data:
+            data.seek(0, os.SEEK_END)
+            position = data.tell()
+            stop = max(0, position - limit)
+            partial = b''
+            while position > stop:
+                size = min(block, position - stop)
+                position -= size
+                data.seek(position)
+                lines = (data.read(size) + partial).split(b'\n')
+                partial = lines.pop(0)
+                for line in reversed(lines):
+                    yield line
+            if position == 0:
+                yield partial
+
+    # Get the last logged in user and the date they logged in.
     def get_last_info(self):
-        cmdlast = ['last', '-wF']
-        runlast = Popen(cmdlast, stdout=PIPE)
-        last = runlast.communicate()[0]
-        last = last.split(b"\n")
-        last = last[0]
-
-        if last:
-            lastentry = last.split()
-            lastentry_formatted = []
-            # Strip away ":0", "pts", and domains from lastentry, this minimizes chance that they
-            # appear differently on different OS's
-            # If the last entry has a regular user, expect these spots to have
-            # the accurate information
-            if re.match(r"[0-9]{4}", str(lastentry[7])):
-                lastentry_formatted += lastentry[0], lastentry[3], lastentry[4], lastentry[5], lastentry[6], lastentry[7]
-            # If the last entry has a "system boot", there's an extra string we
-            # need to account for
-            else:
-                lastentry_formatted += lastentry[0], lastentry[3], lastentry[4], lastentry[5], lastentry[6], lastentry[7]
-
-            lastuser = lastentry_formatted[0]
-            lastuser = lastuser.decode("utf-8")
-            lasttime = b' '.join(lastentry_formatted[1:6])
-            lasttime = lasttime.decode("utf-8")
-            lastlogon = datetime.datetime.strptime(
-                lasttime, "%a %b %d %H:%M:%S %Y").strftime("%Y-%m-%d")
-            lastlogon = "{0}".format(lastlogon)
-        else:
-            lastuser = ''
-            lastlogon = 'NULL'
+        logins = self.get_recent_logins(1)
+        if not logins:
+            return '', 'NULL'
 
-        return lastuser, lastlogon
+        return logins[0]['user'], logins[0]['time'][:10]
+
+    # The most recent user logins, newest first, read straight from wtmp.
+    def get_recent_logins(self, count=None):
+        return wtmp.logins(count or config.recent_logins, host_path(wtmp.WTMP_PATH),
+                           config.wtmp_scan_records)
 
     # Get the proc (core) count. This would be useful for something like telling a
     # service how many cores each machine has to use.
     def get_procs(self, hyperthread_reporting_enabled):
-        with open('/proc/cpuinfo', 'r') as data:
-            cpuinfo = data.readlines()
-            try:
-                physcores = int(
-                    re.sub(r'[^\d.]+', '', [entry for entry in cpuinfo if 'cores' in entry][0]))
-                physcpus = len(
-                    set([entry for entry in cpuinfo if 'physical id' in entry]))
-                physprocs = physcores * physcpus
-            except BaseException:
-                physprocs = len(
-                    [entry for entry in cpuinfo if 'processor' in entry])
-
-        procs = len([entry for entry in cpuinfo if 'processor' in entry])
-
-        cmd = ['/usr/bin/lscpu']
-        run = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        out, err = run.communicate()
-        out = out.split(b"\n")
-
-        threads = [entry for entry in out if b'Thread(s) per core' in entry]
-        threads = int(threads[0].split(b":")[1].strip())
-
-        if physprocs != procs:
-            hyperthread = 1
-        elif threads > 1:
-            hyperthread = 1
-        else:
-            hyperthread = 0
+        cpus = self.get_topology()
+        threads = cpus['threads'] or os.cpu_count()
+        cores = cpus['cores'] or threads
+
+        hyperthread = 1 if cpus['smt'] > 1 else 0
 
         # Only report physical cores, to leave virtual cores as a buffer,
         # so things wouldn't potentially get oversubscribed.
-        if not hyperthread_reporting_enabled and not hyperthread == 0:
-            procs = procs / 2
+        if hyperthread_reporting_enabled:
+            procs = threads
+        else:
+            procs = cores
 
-        cpuname = [entry for entry in cpuinfo if 'model name' in entry][0]
-        cpuname = cpuname.split(":")[1].strip()
+        return procs, hyperthread, self.get_cpu_name()
+
+    # Sockets, physical cores, SMT width, NUMA nodes and cache sizes, from
+    # sysfs.
+    def get_topology(self):
+        return topology.snapshot(host_path(topology.CPU_PATH),
+                                 host_path(topology.NODE_PATH)).as_dict()
+
+    # The CPU model name, from the first processor in /proc/cpuinfo.
+    def get_cpu_name(self):
+        try:
+            with open(host_path('/proc/cpuinfo'), 'r') as data:
+                for line in data:
+                    if line.startswith('model name'):
+                        return line.split(':', 1)[1].strip()
+        except (IOError, OSError):
+            pass
 
-        return procs, hyperthread, cpuname
+        return ''
 
     # Get the uptime of the machine. Format for SQL.
     def get_uptime(self):
         cmdup = ['uptime']
-        runup = Popen(cmdup, stdout=PIPE)
-        uptime = runup.communicate()[0].split(b',')[0].lstrip()
+        uptime = run_cmd(cmdup).split(b',')[0].lstrip()
+        uptime = uptime.decode("utf-8")
+
+        return uptime
+
+    # get_uptime as a coroutine, for the asyncio probe runner.
+    async def get_uptime_async(self):
+        from async_runner import run_cmd_async
+
+        cmdup = ['uptime']
+        uptime = (await run_cmd_async(cmdup)).split(b',')[0].lstrip()
         uptime = uptime.decode("utf-8")
 
         return uptime
 
     # See if the machine has an NVME for tracking purposes.
     def check_nvme(self):
-        cmd = ['/sbin/lspci']
-        run = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        out, err = run.communicate()
-
-        if b'Non-Volatile memory controller' in out:
+        if self.get_device_index().find('pci', device_class=devices.PCI_CLASS_NVME):
             nvme = 1
         else:
             nvme = 0
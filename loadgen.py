@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from optparse import OptionParser
+
+import config
+
+# Load generator for collector.py. Simulates a fleet of hosts posting reports
+# and prints the rate the collector accepted posts at, and, from its /stats
+# counters, the rate rows were actually merged into system_check. The
+# collector coalesces a host's pending reports, so the two differ, and only
+# the second depends on the database. Point the collector at a scratch
+# database (e.g. a local Postgres loaded with schema.sql) first.
+
+
+# A plausible full report for a simulated host.
+def fake_report(index):
+    return {
+        'name': 'loadgen-{0:05d}'.format(index),
+        'ipaddr': '10.{0}.{1}.{2}'.format(index // 65536 % 256, index // 256 % 256, index % 256),
+        'macaddr': '02:00:00:{0:02X}:{1:02X}:{2:02X}'.format(
+            index // 65536 % 256, index // 256 % 256, index % 256),
+        'cpuname': 'Intel(R) Xeon(R) Gold 6248R CPU @ 3.00GHz',
+        'procs': 24,
+        'hyperthread': 1,
+        'ram': random.choice([64, 128, 256]),
+        'ramspeed': '2933',
+        'gpu': 'Quadro RTX 6000',
+        'gpuserial': str(1320000000000 + index),
+        'gpuram': '24576',
+        'gpuarch': 'turing',
+        'ssd': 'S4EVNX0N{0:06d}'.format(index),
+        'lastupdate': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'lastuser': 'user{0}'.format(index % 300),
+        'lastos': 'cent7_64',
+        'uptime': 'up {0} min'.format(random.randint(1, 10000)),
+        'mbserial': 'MB{0:08d}'.format(index),
+        'state': 'up',
+        'nvme': index % 2,
+    }
+
+
+# Heartbeat-sized delta, which is what most agents send most of the time.
+def fake_delta(index):
+    return {
+        'name': 'loadgen-{0:05d}'.format(index),
+        'lastupdate': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'uptime': 'up {0} min'.format(random.randint(1, 10000)),
+        'state': 'up',
+    }
+
+
+class LoadGenerator:
+    def __init__(self, url, hosts, threads, duration, delta_ratio, drain):
+        self.url = url
+        self.stats_url = urllib.parse.urljoin(url, '/stats')
+        self.drain = drain
+        self.hosts = hosts
+        self.threads = threads
+        self.duration = duration
+        self.delta_ratio = delta_ratio
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.refused = 0
+        self.errors = 0
+        self.latency = 0.0
+
+    def post(self, report):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(report).encode("utf-8"),
+            headers={'Content-Type': 'application/json'})
+        start = time.time()
+        try:
+            urllib.request.urlopen(request, timeout=config.collector_timeout).close()
+            status = 'accepted'
+        except urllib.error.HTTPError as e:
+            status = 'refused' if e.code == 503 else 'errors'
+        except (urllib.error.URLError, OSError):
+            status = 'errors'
+
+        with self.lock:
+            setattr(self, status, getattr(self, status) + 1)
+            self.latency += time.time() - start
+
+    # The collector's counters.
+    def stats(self):
+        with urllib.request.urlopen(self.stats_url, timeout=config.collector_timeout) as reply:
+            return json.loads(reply.read().decode("utf-8"))
+
+    # Each worker owns a slice of the fleet and cycles through it.
+    def worker(self, offset, deadline):
+        index = offset
+        while time.time() < deadline:
+            if random.random() < self.delta_ratio:
+                self.post(fake_delta(index))
+            else:
+                self.post(fake_report(index))
+            index += self.threads
+            if index >= self.hosts:
+                index = offset
+
+    def run(self):
+        before = self.stats()
+        deadline = time.time() + self.duration
+        workers = [threading.Thread(target=self.worker, args=(offset, deadline))
+                   for offset in range(self.threads)]
+        start = time.time()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.time() - start
+        during = self.stats()
+
+        # Let the collector write out what it still holds.
+        after = during
+        drain_start = time.time()
+        while after['pending'] and time.time() - drain_start < self.drain:
+            time.sleep(0.2)
+            after = self.stats()
+        drained = time.time() - drain_start
+
+        total = self.accepted + self.refused + self.errors
+        merged = during['merged'] - before['merged']
+        print("hosts:       {0}".format(self.hosts))
+        print("requests:    {0} in {1:.1f}s".format(total, elapsed))
+        print("accepted:    {0} ({1:.0f} posts/s)".format(self.accepted, self.accepted / elapsed))
+        print("refused:     {0} (503 back-pressure)".format(self.refused))
+        print("errors:      {0}".format(self.errors))
+        if total:
+            print("avg latency: {0:.1f} ms".format(self.latency / total * 1000))
+        print("merged:      {0} rows into system_check ({1:.0f} rows/s), {2} flushes".format(
+            merged, merged / elapsed, during['flushes'] - before['flushes']))
+        print("drained:     {0} more rows in {1:.1f}s, {2} still pending".format(
+            after['merged'] - during['merged'], drained, after['pending']))
+
+
+def parse_options():
+    parser = OptionParser()
+    parser.add_option("-u", "--url", action="store", dest="url",
+                      default="http://127.0.0.1:{0}/report".format(config.collector_bind[1]),
+                      help="Collector URL to post to")
+    parser.add_option("-n", "--hosts", type="int", action="store", dest="hosts",
+                      default=config.collector_max_pending * 2,
+                      help="Number of simulated hosts. The default is twice "
+                           "collector_max_pending, so a collector that falls behind refuses with 503")
+    parser.add_option("-t", "--threads", type="int", action="store", dest="threads", default=32,
+                      help="Concurrent posting threads")
+    parser.add_option("-d", "--duration", type="float", action="store", dest="duration", default=30,
+                      help="Seconds to run for")
+    parser.add_option("--delta-ratio", type="float", action="store", dest="delta_ratio", default=0.9,
+                      help="Fraction of posts that are heartbeat deltas rather than full reports")
+    parser.add_option("--drain", type="float", action="store", dest="drain", default=30,
+                      help="Seconds to wait afterwards for the collector to flush what it holds")
+
+    (options, args) = parser.parse_args()
+
+    # Each thread posts for its own slice of hosts.
+    if options.hosts < options.threads:
+        parser.error("--hosts must be at least --threads")
+
+    return options, args
+
+
+if __name__ == '__main__':
+    options, args = parse_options()
+    LoadGenerator(options.url, options.hosts, options.threads,
+                  options.duration, options.delta_ratio, options.drain).run()
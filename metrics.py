@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Timing and failure metrics for the agent's last run: one sample per probe,
+# per command a probe ran and per database or collector round trip. They are
+# published as a node_exporter textfile (config.metrics_textfile) and, with
+# config.metrics_table, as rows in system_check_metrics.
+
+# Exit status recorded for a command killed at its deadline, which may not
+# have been reaped yet.
+TIMED_OUT = -1
+
+HELP = {
+    'system_check_probe_duration_seconds': 'Wall time of each probe on its last run.',
+    'system_check_probe_status': 'Outcome of each probe: ok, cached, error or timeout.',
+    'system_check_command_duration_seconds': 'Wall time of each command a probe ran.',
+    'system_check_command_exit_status':
+        'Exit status of each command; 127 if it could not run, -1 if it timed out.',
+    'system_check_db_duration_seconds': 'Wall time of each database or collector round trip.',
+    'system_check_db_status': 'Outcome of each database or collector round trip.',
+    'system_check_last_push_timestamp_seconds': 'When the agent last pushed a report.',
+}
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    # Set a gauge. labels is a list of (name, value) pairs; the first pair
+    # identifies the series, so a new status replaces the old one rather
+    # than leaving both behind.
+    def set(self, metric, labels, value):
+        labels = tuple(labels)
+        with self.lock:
+            for key in list(self.samples):
+                if key[0] == metric and key[1][:1] == labels[:1]:
+                    del self.samples[key]
+            self.samples[(metric, labels)] = value
+
+    def probe(self, name, seconds, status, error=''):
+        self.set('system_check_probe_duration_seconds', [('probe', name)], seconds)
+        self.set('system_check_probe_status',
+                 [('probe', name), ('status', status), ('error', error)], 1)
+
+    def command(self, name, seconds, status):
+        self.set('system_check_command_duration_seconds', [('command', name)], seconds)
+        self.set('system_check_command_exit_status', [('command', name)], status)
+
+    def db(self, op, seconds, error=''):
+        self.set('system_check_db_duration_seconds', [('op', op)], seconds)
+        self.set('system_check_db_status',
+                 [('op', op), ('status', 'error' if error else 'ok'), ('error', error)], 1)
+
+    # Time a database or collector round trip, recording the exception type
+    # if it raises.
+    @contextmanager
+    def timed(self, op):
+        start = time.time()
+        try:
+            yield
+        except Exception as e:
+            self.db(op, time.time() - start, type(e).__name__)
+            raise
+        self.db(op, time.time() - start)
+
+    # The samples in Prometheus text exposition format.
+    def render(self):
+        with self.lock:
+            samples = sorted(self.samples.items())
+
+        lines = []
+        seen = set()
+        for (metric, labels), value in samples:
+            # One value that isn't a number would make node_exporter reject
+            # the whole file.
+            if not isinstance(value, (int, float)):
+                continue
+            if metric not in seen:
+                seen.add(metric)
+                lines.append('# HELP {0} {1}'.format(metric, HELP.get(metric, metric)))
+                lines.append('# TYPE {0} gauge'.format(metric))
+            pairs = ','.join('{0}="{1}"'.format(label, str(text).replace('\\', '\\\\')
+                                                .replace('"', '\\"').replace('\n', '\\n'))
+                             for label, text in labels)
+            series = '{0}{{{1}}}'.format(metric, pairs) if pairs else metric
+            lines.append('{0} {1}'.format(series, value))
+
+        return '\n'.join(lines) + '\n'
+
+    # Write the textfile-collector file. node_exporter may read it at any
+    # moment, so it is written aside and renamed into place.
+    def write_textfile(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tmp = '{0}.{1}'.format(path, os.getpid())
+        with open(tmp, 'w') as data:
+            data.write(self.render())
+        os.replace(tmp, path)
+
+    # The samples as a JSON array of {metric, labels, value}, for one insert
+    # into system_check_metrics.
+    def to_json(self):
+        with self.lock:
+            samples = sorted(self.samples.items())
+
+        return json.dumps([{'metric': metric, 'labels': dict(labels), 'value': value}
+                           for (metric, labels), value in samples])
+
+
+# Metrics for this process, shared by the probe runner and SystemCheck.
+METRICS = Metrics()
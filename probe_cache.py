@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import json
+import os
+import time
+
+import config
+from state_files import read_json, write_json, open_lock
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# TTL classes a probe can declare.
+PER_BOOT = 'boot'
+HOURLY = 'hourly'
+ALWAYS = 'fresh'
+
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+
+
+# Persistent cache of probe results, scoped to the current boot. Entries for
+# another boot_id are never returned, so per-boot probes re-run after every
+# reboot. Without a boot_id (e.g. on Windows) the cache is disabled.
+class ProbeCache:
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or os.path.join(config.state_dir, 'probe_cache.json')
+        self.max_entries = max_entries or config.probe_cache_entries
+        self.boot_id = self.get_boot_id()
+        self.entries = {}
+        self.dirty = {}
+        self.load()
+
+    def get_boot_id(self):
+        try:
+            with open(BOOT_ID_PATH, 'r') as data:
+                return data.read().strip()
+        except (IOError, OSError):
+            return None
+
+    def enabled(self):
+        return self.boot_id is not None
+
+    # Seconds an entry of the given TTL class stays valid. None means for as
+    # long as the boot lasts, 0 means never cached.
+    def ttl(self, ttl_class):
+        return config.probe_ttls.get(ttl_class, 0)
+
+    def load(self):
+        if not self.enabled():
+            return
+
+        try:
+            cache = read_json(self.path)
+        except (IOError, OSError, ValueError):
+            return
+
+        if isinstance(cache, dict) and cache.get('boot_id') == self.boot_id:
+            self.entries = cache.get('entries', {})
+
+    # Return (True, value) for a fresh entry, otherwise (False, None).
+    def get(self, name, ttl_class):
+        ttl = self.ttl(ttl_class)
+        if not self.enabled() or ttl == 0:
+            return False, None
+
+        entry = self.entries.get(name)
+        if entry is None:
+            return False, None
+        if ttl is not None and time.time() - entry['time'] > ttl:
+            return False, None
+
+        return True, entry['value']
+
+    # Remember a probe's value. Values that can't be stored as JSON, such as
+    # raw command output, are simply not cached.
+    def put(self, name, ttl_class, value):
+        if not self.enabled() or self.ttl(ttl_class) == 0:
+            return
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            return
+
+        entry = {'time': time.time(), 'value': value}
+        self.entries[name] = entry
+        self.dirty[name] = entry
+
+    # Merge this run's entries into the file. Concurrent runs take an
+    # exclusive lock and re-read the file first, so neither loses the other's
+    # results, and the oldest entries are dropped past max_entries.
+    def save(self):
+        if not self.enabled() or not self.dirty:
+            return
+
+        with open_lock(self.path + '.lock') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.entries = {}
+                self.load()
+                self.entries.update(self.dirty)
+                if len(self.entries) > self.max_entries:
+                    newest = sorted(self.entries.items(), key=lambda item: item[1]['time'],
+                                    reverse=True)[:self.max_entries]
+                    self.entries = dict(newest)
+
+                write_json(self.path, {'boot_id': self.boot_id, 'entries': self.entries})
+                self.dirty = {}
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
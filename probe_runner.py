@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+import os
+import queue
+import signal
+import threading
+import time
+from subprocess import Popen, PIPE, CalledProcessError, TimeoutExpired
+
+import config
+from metrics import METRICS, TIMED_OUT
+from probe_cache import ALWAYS
+
+# Called with (cmd, out) after every command run_cmd completes. Set by
+# bench_probes.py to record fixtures.
+recorder = None
+
+# Commands run_cmd has started and not yet finished with, by pid.
+_running = {}
+_running_lock = threading.Lock()
+
+
+# The argv to execute for cmd, with the program taken from
+# config.command_dir when that is set.
+def command_argv(cmd):
+    argv = list(cmd)
+    if config.command_dir:
+        argv[0] = os.path.join(config.command_dir, os.path.basename(argv[0]))
+
+    return argv
+
+
+# Kill a command started with start_new_session, along with anything it
+# started that may still hold its output open.
+def kill_session(pid):
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+
+# Kill every command run_cmd is still waiting on. Called once no probe is
+# waiting for them any more, so a timed-out probe's command doesn't outlive
+# the run.
+def kill_running():
+    with _running_lock:
+        pids = list(_running)
+
+    for pid in pids:
+        kill_session(pid)
+
+
+# Run an external command and return its stdout. The child is killed once it
+# runs past its deadline, so a wedged tool can't hold a worker forever. Each
+# command gets its own session so the kill reaches its children too, and a
+# command that still hasn't let go of its output config.reap_timeout seconds
+# later (one stuck in the kernel ignores SIGKILL) is abandoned. With check, a
+# non-zero exit raises CalledProcessError.
+def run_cmd(cmd, timeout=None, stderr=PIPE, check=False):
+    if timeout is None:
+        timeout = config.probe_timeout
+
+    argv = command_argv(cmd)
+    command = os.path.basename(argv[0])
+    start = time.time()
+    try:
+        run = Popen(argv, stdout=PIPE, stderr=stderr, start_new_session=True)
+    except OSError:
+        METRICS.command(command, time.time() - start, 127)
+        raise
+    with _running_lock:
+        _running[run.pid] = run
+    try:
+        out = run.communicate(timeout=timeout)[0]
+    except TimeoutExpired:
+        kill_session(run.pid)
+        try:
+            run.communicate(timeout=config.reap_timeout)
+        except TimeoutExpired:
+            for pipe in (run.stdout, run.stderr):
+                if pipe is not None:
+                    pipe.close()
+        METRICS.command(command, time.time() - start, TIMED_OUT)
+        raise
+    finally:
+        with _running_lock:
+            _running.pop(run.pid, None)
+    METRICS.command(command, time.time() - start, run.returncode)
+    if check and run.returncode:
+        raise CalledProcessError(run.returncode, argv, out)
+
+    if recorder is not None:
+        recorder(list(cmd), out)
+
+    return out
+
+
+# A single probe: what to call, how long it may take, and what to report
+# if it fails or runs out of time.
+class Probe:
+    def __init__(self, name, func, args=(), timeout=None, fallback='', ttl=ALWAYS):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.timeout = timeout if timeout is not None else config.probe_timeout
+        self.fallback = fallback
+        self.ttl = ttl
+
+
+# Runs independent probes concurrently on a bounded set of worker threads.
+# Each probe's deadline starts when a worker picks it up, so the wall time of
+# a run is set by the slowest probe rather than the sum of all of them. With a
+# ProbeCache, probes whose TTL class hasn't expired are answered without
+# running.
+#
+# Workers are daemon threads: one left behind by a probe that missed its
+# deadline is replaced rather than waited for, and can't hold up exit.
+class ProbeRunner:
+    # Whether probes may be registered as coroutine functions; see
+    # async_runner.AsyncProbeRunner.
+    coroutines = False
+
+    # How often to re-check deadlines while probes are still queued.
+    poll = 0.1
+
+    def __init__(self, workers=None, cache=None):
+        self.workers = workers or config.probe_workers
+        self.cache = cache
+        self.probes = []
+
+    # Register a probe. Positional args are passed through to func.
+    def add(self, name, func, *args, timeout=None, fallback='', ttl=ALWAYS):
+        self.probes.append(Probe(name, func, args, timeout, fallback, ttl))
+
+    # A cached value, restored to the fallback's shape (JSON turns tuples
+    # into lists).
+    def cached(self, probe):
+        if self.cache is None:
+            return False, None
+
+        hit, value = self.cache.get(probe.name, probe.ttl)
+        if hit and isinstance(probe.fallback, tuple) and isinstance(value, list):
+            value = tuple(value)
+
+        return hit, value
+
+    # Cache a probe's value under its TTL class. A value equal to the
+    # fallback is what a probe that swallowed its own failure returns (no
+    # GPUs from a broken nvidia-smi, an unreadable serial), so it isn't kept:
+    # the probe runs again next time instead of reporting it until reboot.
+    def store(self, probe, value):
+        if self.cache is not None and value != probe.fallback:
+            self.cache.put(probe.name, probe.ttl, value)
+
+    # Worker loop: run queued probes until there are none left, posting
+    # (probe, value, exception) for each to done.
+    def _work(self, jobs, done, started):
+        while True:
+            try:
+                probe = jobs.get_nowait()
+            except queue.Empty:
+                return
+
+            started[probe.name] = time.time()
+            try:
+                done.put((probe, probe.func(*probe.args), None))
+            except Exception as e:
+                done.put((probe, None, e))
+
+    def _start_worker(self, jobs, done, started):
+        threading.Thread(target=self._work, args=(jobs, done, started), daemon=True).start()
+
+    # Run every registered probe and return ({name: value}, failed). Probes
+    # that raise or miss their deadline report their fallback instead, and
+    # their names are in the set failed.
+    def run(self):
+        results = {}
+        failed = set()
+        started = {}
+        pending = {}
+        jobs = queue.Queue()
+        done = queue.Queue()
+
+        for probe in self.probes:
+            hit, value = self.cached(probe)
+            if hit:
+                results[probe.name] = value
+                METRICS.probe(probe.name, 0, 'cached')
+            else:
+                pending[probe.name] = probe
+                jobs.put(probe)
+
+        for worker in range(min(self.workers, len(pending))):
+            self._start_worker(jobs, done, started)
+
+        while pending:
+            now = time.time()
+            timeout = self.poll
+            for probe in pending.values():
+                if probe.name in started:
+                    remaining = started[probe.name] + probe.timeout - now
+                    timeout = max(0, min(timeout, remaining))
+
+            try:
+                probe, value, error = done.get(timeout=timeout)
+            except queue.Empty:
+                probe = None
+
+            # A late answer from a probe already reported as timed out is
+            # dropped.
+            if probe is not None and probe.name in pending:
+                del pending[probe.name]
+                elapsed = time.time() - started[probe.name]
+                if error is not None:
+                    results[probe.name] = probe.fallback
+                    failed.add(probe.name)
+                    METRICS.probe(probe.name, elapsed, 'error', type(error).__name__)
+                else:
+                    results[probe.name] = value
+                    METRICS.probe(probe.name, elapsed, 'ok')
+                    self.store(probe, value)
+
+            now = time.time()
+            for probe in list(pending.values()):
+                if probe.name in started and now - started[probe.name] >= probe.timeout:
+                    del pending[probe.name]
+                    results[probe.name] = probe.fallback
+                    failed.add(probe.name)
+                    METRICS.probe(probe.name, now - started[probe.name], 'timeout')
+                    # Its worker is still stuck in the probe; queued probes
+                    # get a fresh one.
+                    if not jobs.empty():
+                        self._start_worker(jobs, done, started)
+
+        # Whatever commands are left belong to probes that timed out.
+        kill_running()
+
+        # A cache that can't be written only costs the next run some forks.
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except (IOError, OSError):
+                pass
+
+        return results, failed
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import json
+import os
+
+import config
+from state_files import read_json, write_json
+
+# Columns sent on every run, whether or not anything else changed.
+HEARTBEAT_COLUMNS = ['name', 'lastupdate', 'uptime', 'state']
+
+# Every column SystemCheck.build_report fills in. Reports read back from the
+# state directory keep only these, as their keys become column names in SQL.
+REPORT_COLUMNS = [
+    'name', 'ipaddr', 'macaddr', 'cpuname', 'cpuarch', 'procs', 'hyperthread',
+    'sockets', 'cores', 'threads', 'smt', 'l2cache', 'l3cache', 'numa', 'ram',
+    'ramspeed', 'gpu', 'gpuserial', 'gpuram', 'gpuarch', 'ssd', 'disks', 'tablet',
+    'devices', 'monitor1', 'serial1', 'monitor2', 'serial2', 'monitors',
+    'lastupdate', 'lastuser', 'lastlogon', 'recentlogins', 'lastos', 'uptime',
+    'mbserial', 'state', 'nvme', 'location',
+]
+
+# Columns that describe the hardware itself. A change in any of them is a
+# new fingerprint and gets a row in system_check_history. The devices and
+# disks inventories are left out, or every USB stick plugged in would be
+# history.
+HARDWARE_COLUMNS = [
+    'macaddr', 'cpuname', 'cpuarch', 'procs', 'hyperthread', 'sockets', 'cores',
+    'threads', 'smt', 'l2cache', 'l3cache', 'numa', 'ram', 'ramspeed',
+    'gpu', 'gpuserial', 'gpuram', 'gpuarch', 'ssd', 'tablet', 'monitor1',
+    'serial1', 'monitor2', 'serial2', 'monitors', 'mbserial', 'nvme',
+]
+
+
+# Stable hash of a report's hardware columns.
+def fingerprint(report):
+    import hashlib
+
+    hardware = [[column, report.get(column)] for column in HARDWARE_COLUMNS]
+
+    return hashlib.sha1(json.dumps(hardware).encode("utf-8")).hexdigest()
+
+
+# Local copy of what the agent last reported, so a run only has to send the
+# columns that changed since then.
+class ReportState:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(config.state_dir, 'last_report.json')
+
+    # The last successfully reported values, or {} if there are none.
+    def load(self):
+        try:
+            last = read_json(self.path)
+        except (IOError, OSError, ValueError):
+            last = {}
+
+        if not isinstance(last, dict):
+            last = {}
+
+        return last
+
+    # Record a report once it has reached the database.
+    def save(self, report):
+        last = self.load()
+        last.update(report)
+        write_json(self.path, last)
+
+    # Forget the snapshot, so the next run pushes every column.
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    # A copy of report in which the stale columns, those whose probe fell
+    # back this run, carry the last reported value instead, or are left out
+    # if there is none. A timed-out nvidia-smi then neither blanks gpu in the
+    # database nor reads as new hardware in history_due.
+    def carry_forward(self, report, stale):
+        if not stale:
+            return report
+
+        last = self.load()
+        if last.get('name') != report.get('name'):
+            last = {}
+
+        carried = dict(report)
+        for column in stale:
+            if column in last:
+                carried[column] = last[column]
+            else:
+                carried.pop(column, None)
+
+        return carried
+
+    # Reduce a full report to the heartbeat plus the columns whose value
+    # differs from the last report. full=True returns the report unchanged.
+    def delta(self, report, full=False):
+        if full:
+            return dict(report)
+
+        last = self.load()
+        if last.get('name') != report.get('name'):
+            return dict(report)
+
+        delta = {}
+        for column, value in report.items():
+            if column in HEARTBEAT_COLUMNS or last.get(column) != value \
+                    or column not in last:
+                delta[column] = value
+
+        return delta
+
+    # Whether this report should be recorded in the history table: the first
+    # report, a new hardware fingerprint, or a change in a tracked field.
+    def history_due(self, report):
+        last = self.load()
+        if last.get('name') != report.get('name'):
+            return True
+        if fingerprint(last) != fingerprint(report):
+            return True
+
+        return any(last.get(field) != report.get(field) for field in config.history_fields)
@@ -0,0 +1,257 @@
+-- Schema for the system_check inventory database.
+--
+-- Apply with: psql -d system_check -f schema.sql
+-- Every statement is safe to re-run against an existing database.
+
+CREATE TABLE IF NOT EXISTS system_check (
+    name        text NOT NULL,
+    class       text,
+    ipaddr      text,
+    macaddr     text,
+    cpuname     text,
+    procs       text,
+    hyperthread text,
+    ram         text,
+    ramspeed    text,
+    gpu         text,
+    gpuserial   text,
+    ssd         text,
+    tablet      text,
+    monitor1    text,
+    serial1     text,
+    monitor2    text,
+    serial2     text,
+    lastupdate  timestamp,
+    lastuser    text,
+    lastlogon   date,
+    lastos      text,
+    state       text,
+    uptime      text,
+    nvme        integer,
+    mbserial    text,
+    gpuram      text,
+    gpuarch     text
+);
+
+-- The agent writes with INSERT ... ON CONFLICT (name), which needs a unique
+-- index on name. Older databases may have been created without one.
+CREATE UNIQUE INDEX IF NOT EXISTS system_check_name_key ON system_check (name);
+
+-- Attribute search (syscheckdb.py -a). Every searchable column is folded into
+-- one text column, each value wrapped in \x1f separators, and kept current by
+-- a trigger. A trigram index on it lets patterns run as index scans instead
+-- of a 25-way OR over a sequential scan. The heartbeat columns (lastupdate,
+-- uptime, state) change on every run, so they are left out and a heartbeat
+-- doesn't recompute the search value. syscheckdb.py filters on them with
+-- --state, --uptime and --updated-since/--updated-before, each of which has
+-- its own index below.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS search text;
+
+CREATE OR REPLACE FUNCTION system_check_search() RETURNS trigger AS $$
+BEGIN
+    NEW.search := E'\x1f' || concat_ws(E'\x1f',
+        NEW.name, NEW.class, NEW.ipaddr, NEW.macaddr, NEW.cpuname, NEW.procs,
+        NEW.ram, NEW.ramspeed, NEW.gpu, NEW.gpuserial, NEW.ssd, NEW.tablet,
+        NEW.monitor1, NEW.serial1, NEW.monitor2, NEW.serial2,
+        NEW.lastuser, NEW.lastlogon::text, NEW.lastos, NEW.nvme::text,
+        NEW.mbserial, NEW.gpuram, NEW.gpuarch) || E'\x1f';
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS system_check_search ON system_check;
+CREATE TRIGGER system_check_search BEFORE INSERT OR UPDATE ON system_check
+    FOR EACH ROW EXECUTE PROCEDURE system_check_search();
+
+-- Fill in rows written before the trigger existed.
+UPDATE system_check SET name = name WHERE search IS NULL;
+
+CREATE INDEX IF NOT EXISTS system_check_search_trgm
+    ON system_check USING gin (search gin_trgm_ops);
+
+-- Machine lookups (syscheckdb.py -m) match name, lastuser or gpu.
+CREATE INDEX IF NOT EXISTS system_check_name_trgm
+    ON system_check USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS system_check_lastuser_trgm
+    ON system_check USING gin (lastuser gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS system_check_gpu_trgm
+    ON system_check USING gin (gpu gin_trgm_ops);
+
+-- Heartbeat filters (syscheckdb.py --state, --uptime, --updated-since and
+-- --updated-before).
+CREATE INDEX IF NOT EXISTS system_check_state_idx ON system_check (state);
+CREATE INDEX IF NOT EXISTS system_check_uptime_trgm
+    ON system_check USING gin (uptime gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS system_check_lastupdate_idx ON system_check (lastupdate);
+
+-- Hardware history. The agent adds a row whenever the hardware fingerprint or
+-- one of config.history_fields changes. The table is range-partitioned by
+-- month so lookups for one host and period only read the partitions they
+-- need, and retention is a matter of dropping whole partitions.
+CREATE TABLE IF NOT EXISTS system_check_history (
+    name        text NOT NULL,
+    recorded    timestamp NOT NULL DEFAULT now(),
+    fingerprint text NOT NULL,
+    report      jsonb NOT NULL
+) PARTITION BY RANGE (recorded);
+
+CREATE INDEX IF NOT EXISTS system_check_history_name_recorded
+    ON system_check_history (name, recorded);
+
+-- Catches rows for months maintenance hasn't created yet.
+CREATE TABLE IF NOT EXISTS system_check_history_default
+    PARTITION OF system_check_history DEFAULT;
+
+-- Create monthly partitions from this month to months_ahead, and drop those
+-- older than retention_months. Run it regularly (syscheckdb.py --maintain).
+-- Rows that already landed in the default partition for a new month are
+-- moved into it.
+CREATE OR REPLACE FUNCTION system_check_history_maintain(months_ahead int, retention_months int)
+RETURNS void AS $$
+DECLARE
+    month_start date;
+    partition_name text;
+    old record;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := (date_trunc('month', now()) + make_interval(months => i))::date;
+        partition_name := 'system_check_history_' || to_char(month_start, 'YYYY_MM');
+
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE system_check_history INCLUDING DEFAULTS)',
+                           partition_name);
+            EXECUTE format('WITH moved AS (DELETE FROM system_check_history_default'
+                           ' WHERE recorded >= %L AND recorded < %L RETURNING *)'
+                           ' INSERT INTO %I SELECT * FROM moved',
+                           month_start, month_start + interval '1 month', partition_name);
+            EXECUTE format('ALTER TABLE system_check_history ATTACH PARTITION %I'
+                           ' FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, month_start, month_start + interval '1 month');
+        END IF;
+    END LOOP;
+
+    FOR old IN
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'system_check_history'::regclass
+          AND c.relname ~ '^system_check_history_[0-9]{4}_[0-9]{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM')
+              < date_trunc('month', now()) - make_interval(months => retention_months)
+    LOOP
+        EXECUTE format('DROP TABLE %I', old.relname);
+    END LOOP;
+END
+$$ LANGUAGE plpgsql;
+
+SELECT system_check_history_maintain(2, 24);
+
+-- Site the host reports from, as worked out by get_location().
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS location text;
+
+-- Fleet capacity reports (syscheckdb.py --report). system_check_capacity turns
+-- the text columns into numbers, and system_check_report aggregates it by
+-- every supported dimension in a single pass. Refresh the materialized view
+-- on a schedule with syscheckdb.py --refresh-reports; it is refreshed
+-- concurrently, so readers are never blocked, and each report is then one
+-- small indexed read.
+CREATE OR REPLACE VIEW system_check_capacity AS
+SELECT name,
+       state,
+       coalesce(nullif(location, ''), 'unknown') AS location,
+       coalesce(nullif(gpuarch, ''), 'none') AS gpuarch,
+       coalesce(nullif(lastos, ''), 'unknown') AS lastos,
+       CASE
+           WHEN ram IS NULL OR ram !~ '^[0-9]+$' THEN 'unknown'
+           WHEN ram::int <= 16 THEN '0016'
+           WHEN ram::int <= 32 THEN '0032'
+           WHEN ram::int <= 64 THEN '0064'
+           WHEN ram::int <= 128 THEN '0128'
+           WHEN ram::int <= 256 THEN '0256'
+           ELSE '0257+'
+       END AS ram_bucket,
+       coalesce(nvme, 0) AS nvme,
+       CASE WHEN procs ~ '^[0-9]+(\.[0-9]+)?$' THEN procs::numeric ELSE 0 END AS cores,
+       CASE WHEN ram ~ '^[0-9]+$' THEN ram::numeric ELSE 0 END AS ram_gb,
+       coalesce(array_length(string_to_array(nullif(gpu, ''), ','), 1), 0) AS gpus,
+       (SELECT coalesce(sum(vram::numeric), 0)
+          FROM unnest(string_to_array(nullif(gpuram, ''), ',')) AS vram
+         WHERE vram ~ '^[0-9]+$') AS vram_mb
+  FROM system_check;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS system_check_report AS
+SELECT d.report,
+       d.value,
+       count(*) AS hosts,
+       count(*) FILTER (WHERE c.state = 'up') AS up,
+       sum(c.cores) AS cores,
+       sum(c.ram_gb) AS ram_gb,
+       sum(c.gpus) AS gpus,
+       sum(c.vram_mb) AS vram_mb
+  FROM system_check_capacity c
+ CROSS JOIN LATERAL (VALUES
+       ('location', c.location),
+       ('gpuarch', c.gpuarch),
+       ('lastos', c.lastos),
+       ('ram', c.ram_bucket),
+       ('nvme', c.nvme::text),
+       ('location_gpuarch', c.location || '/' || c.gpuarch)
+ ) AS d(report, value)
+ GROUP BY d.report, d.value;
+
+-- Needed for REFRESH ... CONCURRENTLY, and what each report reads through.
+CREATE UNIQUE INDEX IF NOT EXISTS system_check_report_key
+    ON system_check_report (report, value);
+
+-- CPU microarchitecture, classified from cpuname by the agent.
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS cpuarch text;
+
+-- Agent timings (metrics.py), written after each push when config.metrics_table
+-- is set. One row per sample: probe and command durations and outcomes, and
+-- database round trips, with the identifying labels in labels.
+CREATE TABLE IF NOT EXISTS system_check_metrics (
+    name        text NOT NULL,
+    recorded    timestamptz NOT NULL DEFAULT now(),
+    metric      text NOT NULL,
+    labels      jsonb,
+    value       double precision
+);
+
+CREATE INDEX IF NOT EXISTS system_check_metrics_metric_idx
+    ON system_check_metrics (metric, recorded);
+CREATE INDEX IF NOT EXISTS system_check_metrics_name_idx
+    ON system_check_metrics (name, recorded);
+
+-- Every attached monitor as decoded from its EDID: model, serial,
+-- manufacturer, size and connector. monitor1/serial1 and monitor2/serial2
+-- still carry the first two.
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS monitors jsonb;
+
+-- The most recent logins on the host, newest first, as
+-- {user, line, host, time} read from wtmp.
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS recentlogins jsonb;
+
+-- CPU topology from sysfs, for packing jobs onto hosts. procs is the
+-- physical core count (or every thread with hyperthread reporting on);
+-- numa lists each node as {node, cpus, memory_mb}. Cache sizes are in KiB:
+-- l2cache per core, l3cache summed over the host.
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS sockets integer;
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS cores integer;
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS threads integer;
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS smt integer;
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS l2cache integer;
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS l3cache integer;
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS numa jsonb;
+
+-- Every PCI and USB device on the host as {bus, address, class, vendor,
+-- product}, plus manufacturer and name for USB. Containment queries such as
+-- devices @> '[{"vendor": "10de"}]' (syscheckdb.py --device) use the index.
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS devices jsonb;
+
+CREATE INDEX IF NOT EXISTS system_check_devices_idx
+    ON system_check USING gin (devices jsonb_path_ops);
+
+-- Every physical disk as {name, model, serial, size, rotational, removable,
+-- transport}, transport being nvme, sata, usb, scsi, virtio or unknown. ssd
+-- stays the comma separated list of solid state serials.
+ALTER TABLE system_check ADD COLUMN IF NOT EXISTS disks jsonb;
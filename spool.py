@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import os
+import random
+import time
+
+import config
+from report_state import REPORT_COLUMNS
+from state_files import read_json, write_json
+
+
+# Local spool for reports that couldn't be written. Reports are kept per host
+# with newer values merged over older ones, so the spool stays one entry per
+# host no matter how long the database is away. Retries back off
+# exponentially with full jitter, so a fleet coming back from an outage
+# doesn't reconnect all at once.
+class Spool:
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or os.path.join(config.state_dir, 'spool.json')
+        self.max_entries = max_entries or config.spool_max_entries
+        self.reports = {}
+        self.failures = 0
+        self.next_attempt = 0
+        self.load()
+
+    def load(self):
+        try:
+            spool = read_json(self.path)
+        except (IOError, OSError, ValueError):
+            return
+
+        if isinstance(spool, dict):
+            self.reports = self.known(spool.get('reports', {}))
+            self.failures = spool.get('failures', 0)
+            self.next_attempt = spool.get('next_attempt', 0)
+
+    def save(self):
+        if not self.reports and not self.failures:
+            self.clear()
+            return
+
+        write_json(self.path, {'reports': self.reports,
+                               'failures': self.failures,
+                               'next_attempt': self.next_attempt})
+
+    # Spooled reports with only the known report columns, keyed by host.
+    # Anything else is dropped, as the columns are written as named.
+    def known(self, reports):
+        if not isinstance(reports, dict):
+            return {}
+
+        return dict((name, dict((column, value) for column, value in report.items()
+                                if column in REPORT_COLUMNS))
+                    for name, report in reports.items()
+                    if isinstance(report, dict) and report.get('name') == name)
+
+    # Drop the spool once everything in it has been written.
+    def clear(self):
+        self.reports = {}
+        self.failures = 0
+        self.next_attempt = 0
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    # A report with anything already spooled for the same host merged under it.
+    def merge(self, report):
+        merged = dict(self.reports.get(report['name'], {}))
+        merged.update(report)
+
+        return merged
+
+    # Spool a report, newest wins per host. Past max_entries the hosts that
+    # were spooled longest ago are dropped.
+    def add(self, report):
+        name = report['name']
+        merged = self.merge(report)
+        self.reports.pop(name, None)
+        self.reports[name] = merged
+
+        while len(self.reports) > self.max_entries:
+            del self.reports[next(iter(self.reports))]
+
+    # Spooled reports for hosts other than name, i.e. left over from an
+    # earlier hostname.
+    def others(self, name):
+        return [report for host, report in self.reports.items() if host != name]
+
+    # Whether the backoff window has passed and a write should be tried.
+    def due(self):
+        return time.time() >= self.next_attempt
+
+    # Record a failed write and push the next attempt out with full jitter.
+    def failed(self):
+        self.failures += 1
+        backoff = min(config.spool_max_backoff, config.spool_base_backoff * 2 ** self.failures)
+        self.next_attempt = time.time() + random.uniform(0, backoff)
+
+    # Put off the next attempt without counting it as a failure, e.g. when
+    # the server is turning writers away.
+    def defer(self, seconds):
+        self.next_attempt = time.time() + random.uniform(0, seconds)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import json
+import os
+import stat
+
+import config
+
+# Reading and writing the agent's files in config.state_dir. The agent runs
+# as root and trusts what it reads back from there, so the directory has to
+# be its own: it is created 0700 and refused if anyone else owns it or group
+# or other can write to it. Files are opened without following symlinks, and
+# written through a temp file created with O_EXCL, so nothing planted in the
+# directory can redirect a write.
+
+# Not every platform has O_NOFOLLOW (Windows doesn't).
+NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+
+
+# The state directory can be tampered with by another user.
+class UnsafeStateDir(OSError):
+    pass
+
+
+# Check that a state directory is safe to use, creating it first if create
+# is set, and return it.
+def check_dir(path=None, create=True):
+    path = path or config.state_dir
+    if create:
+        os.makedirs(path, 0o700, exist_ok=True)
+
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise UnsafeStateDir("{0} is not a directory".format(path))
+    # Windows has neither uids nor mode bits; the directory gets its ACL from
+    # ProgramData.
+    if hasattr(os, 'geteuid'):
+        if info.st_uid != os.geteuid():
+            raise UnsafeStateDir("{0} is not owned by uid {1}".format(path, os.geteuid()))
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise UnsafeStateDir("{0} is writable by group or other".format(path))
+
+    return path
+
+
+# Load a JSON state file. Raises OSError if it is missing, a symlink or in an
+# unsafe directory, and ValueError if it doesn't parse.
+def read_json(path):
+    check_dir(os.path.dirname(path), create=False)
+    with os.fdopen(os.open(path, os.O_RDONLY | NOFOLLOW), 'r') as data:
+        return json.load(data)
+
+
+# Replace a state file with value as JSON. A crashed run can't leave a
+# half-written file, as the temp file is only renamed over it once complete.
+def write_json(path, value):
+    check_dir(os.path.dirname(path))
+
+    tmp = '{0}.{1}'.format(path, os.getpid())
+    # Left behind by an earlier run with the same pid.
+    try:
+        os.remove(tmp)
+    except FileNotFoundError:
+        pass
+
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | NOFOLLOW, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as data:
+            json.dump(value, data, sort_keys=True)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+# Open (creating if needed) a lock file in the state directory.
+def open_lock(path):
+    check_dir(os.path.dirname(path))
+
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | NOFOLLOW, 0o600), 'a')
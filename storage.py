@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import re
+
+from sysfs import read_text, Snapshot
+
+# Disk inventory from /sys/block and /dev/disk/by-id, one scandir pass over
+# each. Every whole physical disk (not partitions, loop, ram, zram, md or
+# device-mapper devices, none of which have a device link) becomes a record
+# with its name, model, serial, size, whether it spins, and its transport.
+
+BLOCK_PATH = '/sys/block'
+BY_ID_PATH = '/dev/disk/by-id'
+
+# by-id link prefixes and the transport they imply.
+BY_ID_TRANSPORTS = {
+    'nvme': 'nvme',
+    'ata': 'sata',
+    'usb': 'usb',
+    'virtio': 'virtio',
+    'scsi': 'scsi',
+}
+
+# How long one scan is reused, so the ssd and disks probes of one run share
+# it while the daemon still sees drives attached since.
+SNAPSHOT_AGE = 10
+
+_snapshot = Snapshot(SNAPSHOT_AGE)
+
+
+# {disk name: [by-id link name, ...]} for whole disks. Partition links and
+# the wwn-/eui. aliases, which carry no model or serial, are skipped.
+def read_by_id(by_id_path):
+    links = {}
+    try:
+        entries = list(os.scandir(by_id_path))
+    except OSError:
+        return links
+
+    for entry in entries:
+        if '-part' in entry.name or entry.name.startswith(('wwn-', 'nvme-eui.', 'nvme-nvme.')):
+            continue
+        try:
+            target = os.path.basename(os.readlink(entry.path))
+        except OSError:
+            continue
+        links.setdefault(target, []).append(entry.name)
+
+    return links
+
+
+# Serial and transport from a disk's by-id links, e.g.
+# ata-Samsung_SSD_860_EVO_1TB_S4X6NF0M123456 -> (S4X6NF0M123456, sata).
+# USB links end in the LUN ("-0:0"), which isn't part of the serial.
+def parse_by_id(names):
+    for name in sorted(names):
+        prefix, _, rest = name.partition('-')
+        if prefix in BY_ID_TRANSPORTS:
+            serial = re.sub(r'-\d+:\d+$', '', rest.rsplit('_', 1)[-1])
+            return serial, BY_ID_TRANSPORTS[prefix]
+
+    return '', ''
+
+
+def disks(block_path=BLOCK_PATH, by_id_path=BY_ID_PATH):
+    links = read_by_id(by_id_path)
+    try:
+        entries = sorted(os.scandir(block_path), key=lambda entry: entry.name)
+    except OSError:
+        return []
+
+    found = []
+    for entry in entries:
+        path = entry.path
+        if not os.path.exists(os.path.join(path, 'device')):
+            continue
+
+        serial, transport = parse_by_id(links.get(entry.name, []))
+        if entry.name.startswith('nvme'):
+            transport = 'nvme'
+        elif entry.name.startswith('vd') and not transport:
+            transport = 'virtio'
+
+        sectors = read_text(os.path.join(path, 'size'))
+        found.append({
+            'name': entry.name,
+            'model': read_text(os.path.join(path, 'device', 'model')),
+            # NVMe controllers publish their serial; SATA and SCSI disks only
+            # have the one in their by-id link.
+            'serial': read_text(os.path.join(path, 'device', 'serial')) or serial,
+            # /sys/block sizes are always in 512-byte sectors.
+            'size': int(sectors) * 512 if sectors.isdigit() else 0,
+            'rotational': read_text(os.path.join(path, 'queue', 'rotational')) == '1',
+            'removable': read_text(os.path.join(path, 'removable')) == '1',
+            'transport': transport or 'unknown',
+        })
+
+    return found
+
+
+# The disk records for this run, scanned again once they are SNAPSHOT_AGE old.
+def snapshot(block_path=BLOCK_PATH, by_id_path=BY_ID_PATH):
+    return _snapshot.get(disks, block_path, by_id_path)
@@ -1,15 +1,21 @@
 #!/tools/bin/python
 
+import json
+import re
 import sys
 from optparse import OptionParser
 
 import psycopg2
 from psycopg2 import connect
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_READ_COMMITTED
 from psycopg2.extras import DictCursor
 
 import config
 
+# Groupings available in the system_check_report materialized view.
+REPORTS = ['location', 'gpuarch', 'lastos', 'ram', 'nvme', 'location_gpuarch']
+
+
 # Add options for scanning all machines (-a) for a specific attribute,
 # or one machine for all of its info by name (-m).
 def parse_options():
@@ -18,118 +24,346 @@ def parse_options():
                       help="Query all machines in the database containing <arg>")
     parser.add_option("-m", "--machine", type="string", action="store",
                       dest="machine", help="Query a specific machine in the database")
+    parser.add_option("-s", "--fetch-size", type="int", action="store", dest="fetch_size",
+                      default=config.syscheckdb_fetch_size,
+                      help="Rows fetched from the server per round trip")
+    parser.add_option("-f", "--format", type="choice", action="store", dest="format",
+                      choices=["table", "json", "ndjson", "csv"], default="table",
+                      help="Output format: table (default), json, ndjson or csv")
+
+    parser.add_option("--device", type="string", action="store", dest="device",
+                      help="Query machines with a PCI or USB device, by VENDOR or VENDOR:PRODUCT id")
+
+    parser.add_option("--state", type="string", action="store", dest="state",
+                      help="Only machines in this state (up or down)")
+    parser.add_option("--uptime", type="string", action="store", dest="uptime",
+                      help="Only machines whose uptime matches this pattern")
+    parser.add_option("--updated-since", type="string", action="store", dest="updated_since",
+                      help="Only machines that reported at or after this time (YYYY-MM-DD [HH:MM])")
+    parser.add_option("--updated-before", type="string", action="store", dest="updated_before",
+                      help="Only machines that last reported before this time (YYYY-MM-DD [HH:MM])")
+
+    parser.add_option("--history", type="string", action="store", dest="history",
+                      help="Show the hardware history of a machine")
+    parser.add_option("--since", type="string", action="store", dest="since",
+                      help="With --history, start at this date (YYYY-MM-DD)")
+    parser.add_option("--maintain", action="store_true", dest="maintain", default=False,
+                      help="Create upcoming history partitions and drop expired ones")
+    parser.add_option("--report", type="choice", action="store", dest="report",
+                      choices=REPORTS, help="Fleet totals grouped by one of: " + ", ".join(REPORTS))
+    parser.add_option("--refresh-reports", action="store_true", dest="refresh_reports",
+                      default=False, help="Refresh the fleet reports (run from cron)")
 
     (options, args) = parser.parse_args()
 
-    if len(sys.argv) < 2:
+    if not (options.all or options.machine or options.device or filtered(options)
+            or options.history or options.maintain or options.report or options.refresh_reports):
         parser.print_help()
         sys.exit(0)
 
     return options, args
 
+# Separator between column values in system_check.search (see schema.sql).
+SEARCH_SEPARATOR = '\x1f'
+
+# Filters on the heartbeat columns, which system_check.search leaves out:
+# the option and its predicate, each answered by an index of its own (see
+# schema.sql). They narrow -a, -m and --device, or select hosts on their own.
+HEARTBEAT_FILTERS = [
+    ('state', "state = %s"),
+    ('uptime', "uptime LIKE %s"),
+    ('updated_since', "lastupdate >= %s"),
+    ('updated_before', "lastupdate < %s"),
+]
+
+
+# Whether any heartbeat filter was given.
+def filtered(options):
+    return any(getattr(options, option, None) for option, predicate in HEARTBEAT_FILTERS)
+
+
 # Connect to our postgres instance.
-sqldb = connect(config.sql_dict["home"])
+def sql_connect():
+    return connect(config.sql_dict["home"])
 
 
-# Connect to the database, parse options, and query postgres for data.
-def check_system_db():
-    rindex = 0
-    cursor = sqldb.cursor()
-    options, args = parse_options()
+# A LIKE pattern as a regular expression that matches one whole value of the
+# search column: % and _ don't match the separator, so a pattern can't run on
+# from one column's value into the next. A backslash makes the next
+# character literal, as in LIKE.
+def search_regex(pattern):
+    parts = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            parts.append('[^' + SEARCH_SEPARATOR + ']*')
+        elif char == '_':
+            parts.append('[^' + SEARCH_SEPARATOR + ']')
+        else:
+            parts.append(re.escape(char))
+
+    return SEARCH_SEPARATOR + ''.join(parts) + SEARCH_SEPARATOR
+
+
+# Build the query for -m, --device or -a and the heartbeat filters, with every
+# value passed as a parameter. -m matches name, lastuser or gpu, each of which
+# has a trigram index. -a matches whole values of the trigram-indexed search
+# column. The heartbeat filters are ANDed on.
+def build_query(options, columns=None):
+    select = " SELECT " + (", ".join(columns) if columns else "system_check.*") + " FROM system_check "
+    where = []
+    params = []
 
     # If -m option, search by name entered.
     if options.machine:
-        cursor.execute(
-            " SELECT system_check.*"
-            + " FROM system_check "
-            #            + " ON name = host "
-            + " WHERE lastuser LIKE '{0}'".format(options.machine)
-            + " OR system_check.name LIKE '{0}'".format(options.machine)
-            + " OR gpu LIKE '{0}'".format(options.machine)
-        )
+        where.append("(lastuser LIKE %s OR name LIKE %s OR gpu LIKE %s)")
+        params += [options.machine] * 3
+
+    # If --device, match the devices inventory by containment, which the
+    # jsonb_path_ops index on devices answers.
+    elif getattr(options, 'device', None):
+        vendor, _, product = options.device.lower().partition(':')
+        device = {'vendor': vendor}
+        if product:
+            device['product'] = product
+        where.append("devices @> %s::jsonb")
+        params.append(json.dumps([device]))
 
     # If -a option, search all machines by attribute entered.
     elif options.all:
-        cursor.execute(
-            " SELECT system_check.*"
-            + " FROM system_check "
-            #            + " ON name = host "
-            #            + " ON system_check.name"
-            + " WHERE system_check.name LIKE '{0}'".format(options.all)
-            + " OR system_check.class LIKE '{0}'".format(options.all)
-            + " OR system_check.ipaddr LIKE '{0}'".format(options.all)
-            + " OR system_check.macaddr LIKE '{0}'".format(options.all)
-            + " OR system_check.cpuname LIKE '{0}'".format(options.all)
-            + " OR system_check.procs LIKE '{0}'".format(options.all)
-            + " OR system_check.ram LIKE '{0}'".format(options.all)
-            + " OR system_check.ramspeed LIKE '{0}'".format(options.all)
-            + " OR system_check.gpu LIKE '{0}'".format(options.all)
-            + " OR system_check.gpuserial LIKE '{0}'".format(options.all)
-            + " OR system_check.ssd LIKE '{0}'".format(options.all)
-            + " OR system_check.tablet LIKE '{0}'".format(options.all)
-            + " OR system_check.monitor1 LIKE '{0}'".format(options.all)
-            + " OR system_check.serial1 LIKE '{0}'".format(options.all)
-            + " OR system_check.monitor2 LIKE '{0}'".format(options.all)
-            + " OR system_check.serial2 LIKE '{0}'".format(options.all)
-            + " OR CAST(system_check.lastupdate AS CHAR) LIKE '{0}'".format(options.all)
-            + " OR system_check.lastuser LIKE '{0}'".format(options.all)
-            + " OR CAST(system_check.lastlogon AS CHAR) LIKE '{0}'".format(options.all)
-            + " OR system_check.lastos LIKE '{0}'".format(options.all)
-            + " OR system_check.state LIKE '{0}'".format(options.all)
-            + " OR system_check.uptime LIKE '{0}'".format(options.all)
-            + " OR CAST(system_check.nvme AS CHAR) LIKE '{0}'".format(options.all)
-            + " OR system_check.mbserial LIKE '{0}'".format(options.all)
-            + " OR system_check.gpuram LIKE '{0}'".format(options.all)
-            + " OR CAST(system_check.gpuarch AS CHAR) LIKE '{0}'".format(options.all)
-        )
-
-    result = cursor.fetchall()
+        where.append("search ~ %s")
+        params.append(search_regex(options.all))
+
+    for option, predicate in HEARTBEAT_FILTERS:
+        value = getattr(options, option, None)
+        if value:
+            where.append(predicate)
+            params.append(value)
+
+    return select + " WHERE " + " AND ".join(where), params
+
+
+# Build the --history query. Bounding recorded lets the planner prune the
+# monthly partitions down to the ones that can hold matching rows.
+def build_history_query(options):
+    sql = (" SELECT name, recorded, fingerprint, report FROM system_check_history "
+           + " WHERE name = %s")
+
+    if options.since:
+        return sql + " AND recorded >= %s ORDER BY recorded", [options.history, options.since]
+
+    return (sql + " AND recorded >= now() - %s * interval '1 day' ORDER BY recorded",
+            [options.history, config.history_window_days])
+
+
+# Build the --report query. Reports read the system_check_report materialized
+# view, so this is an index lookup however big the fleet is.
+def build_report_query(options):
+    return (" SELECT value AS {0}, hosts, up, cores, ram_gb, gpus, vram_mb"
+            " FROM system_check_report WHERE report = %s ORDER BY value".format(options.report),
+            [options.report])
+
+
+# Recompute every report. CONCURRENTLY keeps the view readable meanwhile;
+# it needs the unique index on (report, value) and can't run in a
+# transaction block.
+def refresh_reports(sqldb):
+    sqldb.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    cursor = sqldb.cursor()
+    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY system_check_report")
     cursor.close()
+    sqldb.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
+
+
+# Flatten a history row into the same columns as a system_check row, with
+# when it was recorded and its fingerprint up front.
+def history_row(item):
+    name, recorded, fingerprint, report = item
+    columns = ['name', 'recorded', 'fingerprint']
+    values = [name, recorded, fingerprint]
+    for column, value in report.items():
+        if column not in columns:
+            columns.append(column)
+            values.append(value)
+
+    return columns, values
 
+
+# Create the next history partitions and drop those past retention.
+def maintain(sqldb):
     cursor = sqldb.cursor()
-    cursor.execute(
-        " select column_name "
-        + " from INFORMATION_SCHEMA.COLUMNS where table_name = 'system_check' "
-    )
+    cursor.execute("SELECT system_check_history_maintain(%s, %s)",
+                   [config.history_months_ahead, config.history_retention_months])
+    sqldb.commit()
+    cursor.close()
 
-    result2 = cursor.fetchall()
 
+# Print one host as a padded "column: value" block.
+def print_row(columns, item):
     spacing = 12
 
-    print("")
+    # For item in each row.
+    for rindex, entry in enumerate(columns):
+        # The search column only backs the -a index.
+        if entry == 'search':
+            continue
+
+        entry_string = entry
+        item_string = str(item[rindex])
+
+        # If empty entry, indicate with "-".
+        if len(item_string) == 0 or item_string == "None":
+            item_string = "-"
+
+        # Calculate empty space needed for string to fit nicely.
+        empty_space = spacing - len(entry)
+        # Add the appropriate empty space.
+        spaces = str(empty_space * " ")
+        # Create the entry with the string + empty space.
+        entry_string = spaces + entry_string
+
+        # Indicate between each entry.
+        if rindex == 0:
+            print("----------------------------------------------------")
+
+        entry_row = "{0}: {1}".format(entry_string, item_string)
+        print(entry_row)
+
 
-    # For each column in the row.
-    for item in result:
-        # For item in each row.
-        for entry in result2:
-            entry_string = ''.join(str(entry[0]))
-            item_string = str(item[rindex])
+# Streaming writers for each --format. A writer is handed the column names
+# with the first row and then one row at a time, so nothing is held beyond
+# the current row. The search column only backs the -a index and is skipped.
+class TableWriter:
+    def __init__(self):
+        self.columns = None
 
-            # If empty entry, indicate with "-".
-            if len(item_string) == 0 or item_string == "None":
-                item_string = "-"
+    def row(self, columns, item):
+        if self.columns is None:
+            self.columns = columns
+            print("")
+        print_row(columns, item)
 
-            # Calculate empty space needed for string to fit nicely.
-            empty_space = spacing - len(str(entry[0]))
-            # Add the appropriate empty space.
-            spaces = str(empty_space * " ")
-            # Create the entry with the string + empty space.
-            entry_string = spaces + entry_string
+    def end(self):
+        print("")
 
-            # Indicate between each entry.
-            if entry == ('name',):
-                print("----------------------------------------------------")
 
-            entry_row = "{0}: {1}".format(entry_string, item_string)
-            print(entry_row)
+class NdjsonWriter:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.count = 0
 
-            # Keep track of mutliple items in each row.
-            rindex += 1
+    def encode(self, columns, item):
+        return json.dumps(
+            dict((column, value) for column, value in zip(columns, item) if column != 'search'),
+            default=str)
 
-        # Reset items in each row.
-        rindex = 0
+    def row(self, columns, item):
+        self.out.write(self.encode(columns, item) + "\n")
+        self.count += 1
 
-    print("")
+    def end(self):
+        self.out.flush()
+
+
+# A single JSON array, written element by element.
+class JsonWriter(NdjsonWriter):
+    def row(self, columns, item):
+        self.out.write("[\n" if self.count == 0 else ",\n")
+        self.out.write(self.encode(columns, item))
+        self.count += 1
+
+    def end(self):
+        self.out.write("[]\n" if self.count == 0 else "\n]\n")
+        self.out.flush()
+
+
+WRITERS = {
+    'table': TableWriter,
+    'json': JsonWriter,
+    'ndjson': NdjsonWriter,
+}
+
+
+# CSV goes through COPY ... TO STDOUT, so the server formats every cell and
+# the client only copies bytes through.
+def copy_csv(sqldb, options, out=sys.stdout):
+    cursor = sqldb.cursor()
+
+    if options.history:
+        sql, params = build_history_query(options)
+    elif options.report:
+        sql, params = build_report_query(options)
+    else:
+        # A zero-row run of the query gives the column list without the
+        # search column.
+        sql, params = build_query(options)
+        cursor.execute(sql + " LIMIT 0", params)
+        columns = [column[0] for column in cursor.description if column[0] != 'search']
+        sql, params = build_query(options, columns)
+
+    query = cursor.mogrify(sql, params).decode("utf-8")
+    cursor.copy_expert("COPY ({0}) TO STDOUT WITH (FORMAT csv, HEADER)".format(query), out)
+    out.flush()
+    cursor.close()
+
+
+# Connect to the database, parse options, and query postgres for data.
+# Rows stream through a server-side cursor, fetch_size at a time, so the
+# first host prints straight away and memory stays flat however many match.
+def check_system_db():
+    options, args = parse_options()
+    sqldb = sql_connect()
+
+    if options.maintain:
+        maintain(sqldb)
+    if options.refresh_reports:
+        refresh_reports(sqldb)
+    if not (options.all or options.machine or options.device or filtered(options)
+            or options.history or options.report):
+        sqldb.close()
+        return
+
+    if options.format == 'csv':
+        copy_csv(sqldb, options)
+        sqldb.close()
+        return
+
+    writer = WRITERS[options.format]()
+    cursor = sqldb.cursor(name='syscheckdb')
+    cursor.itersize = options.fetch_size
+    if options.history:
+        sql, params = build_history_query(options)
+        cursor.execute(sql, params)
+        for item in cursor:
+            writer.row(*history_row(item))
+    elif options.report:
+        sql, params = build_report_query(options)
+        cursor.execute(sql, params)
+        columns = None
+        for item in cursor:
+            if columns is None:
+                columns = [column[0] for column in cursor.description]
+            writer.row(columns, item)
+    else:
+        sql, params = build_query(options)
+        cursor.execute(sql, params)
+
+        columns = None
+        for item in cursor:
+            # Column names are known once the first batch has arrived.
+            if columns is None:
+                columns = [column[0] for column in cursor.description]
+            writer.row(columns, item)
+
+    writer.end()
+
+    cursor.close()
+    sqldb.close()
 
 
 if __name__ == "__main__":
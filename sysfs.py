@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import os
+import threading
+import time
+
+import config
+
+# Helpers shared by the probes that read host files directly (sysfs, DMI,
+# wtmp) instead of running a command.
+
+
+# A host file's path under config.host_root.
+def host_path(path):
+    if not config.host_root or config.host_root == '/':
+        return path
+
+    return os.path.join(config.host_root, path.lstrip('/'))
+
+
+# A small text file's contents, stripped, or '' if it can't be read. Most
+# sysfs attributes are one line.
+def read_text(path):
+    try:
+        with open(path, 'r') as data:
+            return data.read().strip()
+    except (IOError, OSError, UnicodeDecodeError):
+        return ''
+
+
+# A value built on first use and shared by every probe of a run, such as one
+# walk of a sysfs tree. With max_age it is built again once it is that many
+# seconds old, so a daemon sees hardware that changes without a reboot.
+class Snapshot:
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.value = None
+        self.taken = 0
+
+    # The current value, from build(*args) if there is none yet or it's too
+    # old.
+    def get(self, build, *args):
+        with self.lock:
+            if self.value is None or (self.max_age is not None
+                                      and time.time() - self.taken > self.max_age):
+                self.value = build(*args)
+                self.taken = time.time()
+
+            return self.value
@@ -1,27 +1,40 @@
 #!/usr/bin/env python
 
-import psycopg2
-from psycopg2.extras import DictCursor
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from psycopg2 import connect
 # Config file for storing configurable variables.
 import config
-# Modules per OS
-from linux_platform import LinuxPlatform
-from windows_platform import WindowsPlatform
-from cross_platform import CrossPlatform
+from cross_platform import CP
+from probe_runner import ProbeRunner
+from metrics import METRICS
+from probe_cache import ProbeCache, PER_BOOT, HOURLY, ALWAYS
+from report_state import ReportState, fingerprint
+from spool import Spool
+from state_files import check_dir
 import os
 import sys
+import json
+import random
 import time
-import datetime
-import traceback
-import smtplib
 import warnings
-from optparse import OptionParser
-from email.message import Message
-from subprocess import Popen, PIPE
+
+# The database driver, the collector client, the per-OS platform modules and
+# the daemon are imported where they are first needed, so --collect starts
+# without loading any of them. bench_import.py keeps an eye on this.
+
 os.environ['PATH'] += os.pathsep + '/tools/bin'
-os_version = CrossPlatform().get_os_version()
+
+# Advisory lock class id for the write admission slots.
+ADMISSION_LOCK = 7411
+
+# Report columns derived from each probe that doesn't fill a column of the
+# same name. When a probe falls back, these are the columns that are stale.
+PROBE_COLUMNS = {
+    'gpus': ['gpu', 'gpuserial', 'gpuram', 'gpuarch'],
+    'monitors': ['monitors', 'monitor1', 'serial1', 'monitor2', 'serial2'],
+    'last_info': ['lastuser', 'lastlogon'],
+    'logins': ['recentlogins'],
+    'procs': ['procs', 'hyperthread', 'cpuname', 'cpuarch'],
+    'topology': ['sockets', 'cores', 'threads', 'smt', 'l2cache', 'l3cache', 'numa'],
+}
 
 # Ignore sys warnings.
 if not sys.warnoptions:
@@ -32,37 +45,48 @@ if not sys.warnoptions:
 class SystemCheck:
     def __init__(self, sql_dict):
         self.sysos = CP.get_os()
+        self.dbh = None
 
-        if self.sysos == 'linux':
-            self.location = LinuxPlatform().get_location()
-        elif self.sysos == 'windows':
-            self.location = WindowsPlatform().get_location()
+        self.location = self.get_osclass().get_location()
 
         if self.location in sql_dict:
             self.db_info = sql_dict[self.location]
         else:
             print("Location not found.")
 
-    # Establishes a connection to DD's SQL database
+    # Establishes a connection to DD's SQL database. The connection is kept
+    # open for the rest of the run, so repeated calls are free.
     def sql_connect(self, db_info):
-        self.dbh = connect("{0}".format(db_info))
+        if self.dbh is not None and not self.dbh.closed:
+            return
+
+        from psycopg2 import connect
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+        from psycopg2.extras import DictCursor
+
+        with METRICS.timed('connect'):
+            self.dbh = connect("{0}".format(db_info), client_encoding='UTF8')
         self.dbh.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         self.cursor = self.dbh.cursor(cursor_factory=DictCursor)
-        sql = "SET client_encoding = 'UTF8'"
-        self.cursor.execute(sql)
+
+    # Close the run's connection, if one was opened.
+    def sql_close(self):
+        if self.dbh is not None and not self.dbh.closed:
+            self.dbh.close()
+        self.dbh = None
 
     # Actually updates the db
-    def sql_update(self, sql):
+    def sql_update(self, sql, params=None):
         self.sql_connect(self.db_info)
-        self.cursor.execute(sql)
-        self.dbh.close()
+        with METRICS.timed('update'):
+            self.cursor.execute(sql, params)
 
     # Retrieve info from the db
-    def sql_query(self, sql):
+    def sql_query(self, sql, params=None):
         self.sql_connect(self.db_info)
-        self.cursor.execute(sql)
-        result = self.cursor.fetchone()
-        self.dbh.close()
+        with METRICS.timed('query'):
+            self.cursor.execute(sql, params)
+            result = self.cursor.fetchone()
 
         return result
 
@@ -76,103 +100,471 @@ class SystemCheck:
 
         return mclass
 
-    # Checks if an entry exists for the host and creates an empty one if not
-    def check_sql(self, name):
-        sqlname = "select name from system_check where name='{0}'".format(name)
-        result = self.sql_query(sqlname)
+    # Build a single statement that creates the host's row if it is missing
+    # and updates every reported column, with the values passed as parameters.
+    def build_upsert(self, report):
+        columns = list(report.keys())
+        sql = "insert into system_check ({0}) values ({1}) on conflict (name) do update set {2}" \
+            .format(', '.join(columns),
+                    ', '.join(['%s'] * len(columns)),
+                    ', '.join("{0} = excluded.{0}".format(column) for column in columns if column != 'name'))
 
-        try:
-            result["name"] == name
-        except Exception as e:
-            sqlupdate = "insert into system_check (name) values ('{0}')".format(
-                name)
-            SC.sql_update(sqlupdate)
+        # Structured columns such as monitors are stored as jsonb.
+        params = [json.dumps(report[column]) if isinstance(report[column], (list, dict))
+                  else report[column] for column in columns]
 
-    # Determine what values to push to SQL
-    def get_updates(self):
-        name = CP.get_name()
-        mclass = self.check_allowed(name)
-        location = self.location
-        ipaddr = CP.get_ip()
-        smi = r'nvidia-smi'
+        return sql, params
 
+    # The platform class that knows how to probe this OS.
+    def get_osclass(self):
         if self.sysos == 'windows':
+            from windows_platform import WindowsPlatform
             osclass = WindowsPlatform()
         elif self.sysos == 'linux':
+            from linux_platform import LinuxPlatform
             osclass = LinuxPlatform()
 
+        return osclass
+
+    # Register every probe with the runner. The independent probes run
+    # concurrently, each with its own deadline and a fallback if it fails or
+    # hangs. Hardware that can't change without a reboot is PER_BOOT.
+    def add_probes(self, runner, osclass):
         # Including this option for whether or not we want Race to handle hyperthread reporting.
         # "True"  = all threads (physical + virtual)
         # "False" = physical threads only
         hyperthread_reporting_enabled = False
 
-        # Cross platform check
+        # The asyncio runner takes coroutine versions of the probes that run
+        # commands, where the platform has them.
+        gpu_inventory = CP.get_gpu_inventory
+        uptime = osclass.get_uptime
+        if runner.coroutines:
+            gpu_inventory = CP.get_gpu_inventory_async
+            uptime = getattr(osclass, 'get_uptime_async', uptime)
+
+        runner.add('ipaddr', CP.get_ip, fallback='0.0.0.0', ttl=ALWAYS)
+        runner.add('mbserial', osclass.get_mb_serial, ttl=PER_BOOT)
+        runner.add('gpus', gpu_inventory, config.nvidia_smi, fallback=[], ttl=PER_BOOT)
+        runner.add('ram', osclass.get_ram, ttl=PER_BOOT)
+        runner.add('ramspeed', osclass.get_ram_speed, ttl=PER_BOOT)
+        runner.add('ssd', osclass.get_ssd, ttl=HOURLY)
+        runner.add('disks', osclass.get_disks, fallback=[], ttl=HOURLY)
+        runner.add('tablet', osclass.get_tablet, ttl=HOURLY)
+        runner.add('devices', osclass.get_devices, fallback=[], ttl=HOURLY)
+        runner.add('monitors', osclass.get_monitors, fallback=[], ttl=HOURLY)
+        runner.add('last_info', osclass.get_last_info, fallback=('', 'NULL'), ttl=ALWAYS)
+        runner.add('logins', osclass.get_recent_logins, fallback=[], ttl=ALWAYS)
+        runner.add('procs', osclass.get_procs, hyperthread_reporting_enabled,
+                   fallback=(0, 0, ''), ttl=PER_BOOT)
+        runner.add('topology', osclass.get_topology, fallback={}, ttl=PER_BOOT)
+        runner.add('uptime', uptime, ttl=ALWAYS)
+        runner.add('nvme', osclass.check_nvme, fallback=0, ttl=PER_BOOT)
+
+    # Determine what values to push to SQL. Also returns the columns whose
+    # probes fell back, for push_report.
+    def get_updates(self, runner=None):
+        name = CP.get_name()
+        mclass = self.check_allowed(name)
+
+        # Probes whose TTL class hasn't expired are served from the cache.
+        if runner is None:
+            runner = ProbeRunner(cache=ProbeCache())
+        self.add_probes(runner, self.get_osclass())
+        probes, failed = runner.run()
+        report = self.build_report(name, probes)
+
+        return name, report['ipaddr'], report, self.stale_columns(failed)
+
+    # The report columns filled in from the named probes.
+    def stale_columns(self, probes):
+        columns = []
+        for probe in probes:
+            columns += PROBE_COLUMNS.get(probe, [probe])
+
+        return columns
+
+    # Turn probe results into the row pushed to system_check.
+    def build_report(self, name, probes):
+        location = self.location
+        ipaddr = probes['ipaddr']
         macaddr = CP.get_mac()
         lastupdate = CP.get_current_time()
-        mbserial = osclass.get_mb_serial()
-        gpu = CP.get_gpu(smi)
-        gpuserial = CP.get_gpu_serial(smi)
-        gpuram = CP.get_gpu_ram(smi)
-        gpuarch = CP.get_gpu_arch(gpu)
+        mbserial = probes['mbserial']
+        gpus = probes['gpus']
+        gpu = CP.get_gpu(gpus)
+        gpuserial = CP.get_gpu_serial(gpus)
+        gpuram = CP.get_gpu_ram(gpus)
+        gpuarch = CP.get_gpu_arch(gpu.split(','))
         lastos = CP.get_os_version()
-        ram = osclass.get_ram()
-        ramspeed = osclass.get_ram_speed()
-        ssd = osclass.get_ssd()
-        tablet = osclass.get_tablet()
-        monitor1, serial1, monitor2, serial2 = osclass.get_monitor_info()
-        lastuser, lastlogon = osclass.get_last_info()
-        procs, hyperthread, cpuname = osclass.get_procs(
-            hyperthread_reporting_enabled)
-        uptime = osclass.get_uptime()
-        nvme = osclass.check_nvme()
+        ram = probes['ram']
+        ramspeed = probes['ramspeed']
+        ssd = probes['ssd']
+        disks = probes['disks']
+        tablet = probes['tablet']
+        devices = probes['devices']
+        # A cached value from an older agent may still be the four columns.
+        monitors = [monitor for monitor in probes['monitors'] if isinstance(monitor, dict)]
+        monitor1, serial1, monitor2, serial2 = CP.get_monitor_columns(monitors)
+        lastuser, lastlogon = probes['last_info']
+        recentlogins = probes['logins']
+        procs, hyperthread, cpuname = probes['procs']
+        cpuarch = CP.get_cpu_arch(cpuname)
+        cpus = probes['topology']
+        uptime = probes['uptime']
+        nvme = probes['nvme']
+
+        if lastlogon == 'NULL':
+            lastlogon = None
 
         # The BIG general push.
-        sqlupdate = "update system_check set ipaddr='{0}', macaddr='{1}', cpuname = '{2}', procs='{3}', \
-        hyperthread='{4}', ram='{5}', ramspeed='{6}', gpu='{7}', gpuserial='{8}', gpuram='{9}', \
-        gpuarch='{10}', ssd='{11}', tablet='{12}', monitor1='{13}', serial1='{14}', monitor2='{15}', \
-        serial2='{16}', lastupdate='{17}', lastuser='{18}', lastlogon='{19}', lastos='{20}', \
-        uptime='{21}', mbserial='{22}', state='up', nvme='{23}' where name='{24}'" \
-        .format(ipaddr, macaddr, cpuname, procs, hyperthread, ram, ramspeed, gpu, gpuserial, gpuram, \
-                gpuarch, ssd, tablet, monitor1, serial1, monitor2, serial2, lastupdate, lastuser, lastlogon, \
-                lastos, uptime, mbserial, nvme, name)
+        report = {
+            'name': name,
+            'ipaddr': ipaddr,
+            'macaddr': macaddr,
+            'cpuname': cpuname,
+            'cpuarch': cpuarch,
+            'procs': procs,
+            'hyperthread': hyperthread,
+            'sockets': cpus.get('sockets'),
+            'cores': cpus.get('cores'),
+            'threads': cpus.get('threads'),
+            'smt': cpus.get('smt'),
+            'l2cache': cpus.get('l2cache'),
+            'l3cache': cpus.get('l3cache'),
+            'numa': cpus.get('numa'),
+            'ram': ram,
+            'ramspeed': ramspeed,
+            'gpu': gpu,
+            'gpuserial': gpuserial,
+            'gpuram': gpuram,
+            'gpuarch': gpuarch,
+            'ssd': ssd,
+            'disks': disks,
+            'tablet': tablet,
+            'devices': devices,
+            'monitor1': monitor1,
+            'serial1': serial1,
+            'monitor2': monitor2,
+            'serial2': serial2,
+            'monitors': monitors,
+            'lastupdate': lastupdate,
+            'lastuser': lastuser,
+            'lastlogon': lastlogon,
+            'recentlogins': recentlogins,
+            'lastos': lastos,
+            'uptime': uptime,
+            'mbserial': mbserial,
+            'state': 'up',
+            'nvme': nvme,
+            'location': location,
+        }
 
         # Linux specific check.
         if self.sysos == 'linux':
-            #LinuxPlatform() checks here
-            #
-            #
-            
-            # The BIG linux push, just in case linux needs extra parameters.
-            sqlupdate = "update system_check set ipaddr='{0}', macaddr='{1}', cpuname = '{2}', procs='{3}', \
-	    hyperthread='{4}', ram='{5}', ramspeed='{6}', gpu='{7}', gpuserial='{8}', gpuram='{9}', \
-            gpuarch='{10}', ssd='{11}', tablet='{12}', monitor1='{13}', serial1='{14}', monitor2='{15}', \
-            serial2='{16}', lastupdate='{17}', lastuser='{18}', lastlogon='{19}', lastos='{20}', \
-            uptime='{21}', mbserial='{22}', state='up', nvme='{23}' where name='{24}'" \
-            .format(ipaddr, macaddr, cpuname, procs, hyperthread, ram, ramspeed, gpu, gpuserial, gpuram, \
-                    gpuarch, ssd, tablet, monitor1, serial1, monitor2, serial2, lastupdate, lastuser, lastlogon, \
-                    lastos, uptime, mbserial, location, nvme, name)
-
-        self.check_sql(name)
-
-        return name, ipaddr, sqlupdate
+            #LinuxPlatform() checks here, just in case linux needs extra
+            #parameters in the report.
+            pass
+
+        # Some probes still hand back raw command output.
+        for column, value in report.items():
+            if isinstance(value, bytes):
+                report[column] = value.decode("utf-8", "replace")
+
+        return report
+
+    # Write a report to the database. Only the columns that changed since the
+    # last successful push are sent, plus the heartbeat, unless full is set.
+    # stale columns, whose probes fell back, keep their last reported value.
+    # Anything left in the spool by earlier failures goes in the same batch;
+    # if this write fails too, the report joins the spool and the next
+    # attempt is backed off.
+    def push_report(self, report, full=False, stale=()):
+        import urllib.error
+
+        state = ReportState()
+        spool = Spool()
+        report = state.carry_forward(report, stale)
+        update = spool.merge(state.delta(report, full))
+        history = state.history_due(report)
+
+        if not spool.due():
+            spool.add(update)
+            spool.save()
+            print("Database backing off, report spooled.")
+            return
+
+        try:
+            if config.collector_url:
+                for spooled in spool.others(report['name']):
+                    self.post_report(spooled)
+                # The collector records history for reports that carry a
+                # fingerprint, so send the whole report when one is due.
+                if history:
+                    posted = dict(report)
+                    posted['fingerprint'] = fingerprint(report)
+                    self.post_report(posted)
+                else:
+                    self.post_report(update)
+            elif not self.write_reports(spool.others(report['name']), update, report, history):
+                spool.add(update)
+                spool.defer(config.admission_wait * config.admission_retries)
+                spool.save()
+                print("Database busy, report spooled.")
+                return
+        except urllib.error.HTTPError as e:
+            spool.add(update)
+            if e.code != 503:
+                spool.failed()
+                spool.save()
+                raise
+            spool.defer(int(e.headers.get('Retry-After', config.admission_wait)))
+            spool.save()
+            print("Collector busy, report spooled.")
+            return
+        except Exception:
+            spool.add(update)
+            spool.failed()
+            spool.save()
+            raise
+
+        spool.clear()
+        state.save(report)
+
+    # Take one of config.admission_slots advisory locks, so the server never
+    # has more than that many agents writing at once. Busy agents disconnect,
+    # wait a jittered moment and try again, so waiting doesn't hold one of
+    # the server's connections either. Returns False, disconnected, if no
+    # slot came free.
+    def admit(self):
+        if not config.admission_slots:
+            return True
+
+        for attempt in range(config.admission_retries):
+            result = self.sql_query(
+                "select slot from generate_series(0, %s - 1) slot"
+                " where pg_try_advisory_lock(%s, slot) limit 1",
+                [config.admission_slots, ADMISSION_LOCK])
+            if result is not None:
+                return True
+            self.sql_close()
+            if attempt + 1 < config.admission_retries:
+                time.sleep(random.uniform(0, config.admission_wait))
+
+        return False
+
+    # Write this host's update, plus any spooled reports and a history row if
+    # one is due, in one transaction. Returns False without writing if the
+    # server didn't admit us.
+    def write_reports(self, spooled, update, report, history=False):
+        if not self.admit():
+            return False
+        self.sql_connect(self.db_info)
+
+        self.dbh.autocommit = False
+        try:
+            with METRICS.timed('write'):
+                for other in spooled:
+                    sql, params = self.build_upsert(other)
+                    self.cursor.execute(sql, params)
+
+                sql, params = self.build_upsert(update)
+                self.cursor.execute(sql + " returning (xmax = 0) as inserted", params)
+                result = self.cursor.fetchone()
+
+                # A freshly inserted row only has the columns we sent, so fill
+                # in the rest before trusting the snapshot.
+                if result["inserted"] and len(update) < len(report):
+                    sql, params = self.build_upsert(report)
+                    self.cursor.execute(sql, params)
+
+                if history:
+                    self.cursor.execute(
+                        "insert into system_check_history (name, recorded, fingerprint, report)"
+                        " values (%s, %s, %s, %s)",
+                        [report['name'], report['lastupdate'], fingerprint(report),
+                         json.dumps(report)])
+
+                self.dbh.commit()
+        except Exception:
+            self.dbh.rollback()
+            raise
+        finally:
+            self.dbh.autocommit = True
+            # Hand the admission slot back; the daemon keeps its connection.
+            if config.admission_slots:
+                self.cursor.execute("select pg_advisory_unlock_all()")
+
+        return True
+
+    # Hand a report to the central collector instead of writing it to the
+    # database ourselves. A busy collector answers 503, which raises here.
+    def post_report(self, update):
+        import urllib.request
+
+        request = urllib.request.Request(
+            config.collector_url,
+            data=json.dumps(update).encode("utf-8"),
+            headers={'Content-Type': 'application/json'})
+        with METRICS.timed('collector'):
+            urllib.request.urlopen(request, timeout=config.collector_timeout).close()
+
+    # Flag the host as down, e.g. when the daemon is stopped.
+    def mark_down(self, name):
+        if config.collector_url:
+            self.post_report({'name': name, 'state': 'down', 'lastupdate': CP.get_current_time()})
+            return
+
+        self.sql_update("update system_check set state = 'down', lastupdate = %s where name = %s",
+                        [CP.get_current_time(), name])
+
+    # Publish the run's metrics to the textfile collector and, if enabled,
+    # to system_check_metrics over the connection the push already opened.
+    # Metrics are best effort and never fail a run or open a connection of
+    # their own.
+    def publish_metrics(self, name):
+        METRICS.set('system_check_last_push_timestamp_seconds', [], time.time())
+
+        if config.metrics_textfile:
+            try:
+                METRICS.write_textfile(config.metrics_textfile)
+            except (IOError, OSError) as e:
+                print("Failed to write metrics.")
+                print(e)
+
+        if config.metrics_table and self.dbh is not None and not self.dbh.closed:
+            try:
+                self.sql_update(
+                    "insert into system_check_metrics (name, metric, labels, value)"
+                    " select %s, m->>'metric', m->'labels', (m->>'value')::float8"
+                    " from jsonb_array_elements(%s::jsonb) m",
+                    [name, METRICS.to_json()])
+            except Exception as e:
+                print("Failed to write metrics.")
+                print(e)
 
     # Push to SQL
-    def do_update(self):
+    def do_update(self, full=False, runner=None):
+        name = None
+        try:
+            name, ipaddr, report, stale = self.get_updates(runner)
+            self.push_report(report, full, stale)
+        except Exception as e:
+            print("Failed to update database.")
+            print(e)
+        finally:
+            if name is not None:
+                self.publish_metrics(name)
+            self.sql_close()
+
+    # do_update on one event loop: the probes run on an AsyncProbeRunner
+    # while the database connection is opened alongside them (unless writes
+    # go through admission), then the push
+    # goes through a single worker thread, as psycopg2 has no asyncio API.
+    async def do_update_async(self, full=False, runner=None):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from async_runner import AsyncProbeRunner
+
+        loop = asyncio.get_running_loop()
+        database = ThreadPoolExecutor(max_workers=1)
+        name = None
         try:
-            name, ipaddr, sqlupdate = self.get_updates()
-            self.check_sql(name)
-            self.sql_update(sqlupdate)
+            name = CP.get_name()
+            self.check_allowed(name)
+
+            if runner is None:
+                runner = AsyncProbeRunner(cache=ProbeCache())
+            self.add_probes(runner, self.get_osclass())
+
+            # Under admission the connection waits for a slot instead, so it
+            # isn't held through the probes.
+            connect = None
+            if not config.collector_url and not config.admission_slots:
+                connect = loop.run_in_executor(database, self.sql_connect, self.db_info)
+
+            probes, failed = await runner.run_async()
+            report = self.build_report(name, probes)
+
+            # A failed connect is retried, and reported, by the push.
+            if connect is not None:
+                try:
+                    await connect
+                except Exception:
+                    pass
+
+            await loop.run_in_executor(database, self.push_report, report, full,
+                                       self.stale_columns(failed))
         except Exception as e:
             print("Failed to update database.")
             print(e)
+        finally:
+            if name is not None:
+                self.publish_metrics(name)
+            self.sql_close()
+            database.shutdown()
+
+
+# Command line options for the agent.
+def parse_options():
+    from optparse import OptionParser
+
+    parser = OptionParser()
+    parser.add_option("-f", "--full", action="store_true", dest="full", default=False,
+                      help="Push every column instead of only the ones that changed")
+    parser.add_option("-s", "--splay", type="int", action="store", dest="splay",
+                      default=config.splay_interval,
+                      help="Spread start times over this many seconds, offset by hostname")
+    parser.add_option("-d", "--daemon", action="store_true", dest="daemon", default=False,
+                      help="Stay resident and push changes as each probe is rescheduled")
+    parser.add_option("-c", "--collect", action="store_true", dest="collect", default=False,
+                      help="Print the report as JSON instead of pushing it")
+    parser.add_option("-a", "--async", action="store_true", dest="use_async", default=False,
+                      help="Run the probes and the push on one asyncio event loop")
+
+    (options, args) = parser.parse_args()
+
+    return options, args
 
 
 if __name__ == '__main__':
-    CP = CrossPlatform()
+    options, args = parse_options()
     SC = SystemCheck(config.sql_dict)
 
+    # Collect-only: probe and print what would be reported, without touching
+    # the database, the collector or the local report state.
+    if options.collect:
+        runner = None
+        if options.use_async:
+            from async_runner import AsyncProbeRunner
+            runner = AsyncProbeRunner(cache=ProbeCache())
+        name, ipaddr, report, stale = SC.get_updates(runner)
+        json.dump(report, sys.stdout, indent=1, sort_keys=True, default=str)
+        sys.stdout.write("\n")
+        sys.exit(0)
+
+    # Everything past here reads and writes the state directory.
     try:
-        SC.do_update()
+        check_dir()
+    except OSError as e:
+        print("Refusing to run: {0}".format(e))
+        sys.exit(1)
+
+    # Hosts on the same cron schedule start at a stable per-host offset
+    # instead of all at the top of the interval.
+    if options.splay and not options.daemon:
+        time.sleep(CP.get_splay(options.splay))
+
+    try:
+        if options.daemon:
+            from agent_daemon import SystemCheckDaemon
+            SystemCheckDaemon(SC).run()
+        elif options.use_async:
+            import asyncio
+            asyncio.run(SC.do_update_async(options.full))
+        else:
+            SC.do_update(options.full)
     except Exception as e:
+        import traceback
         print(e)
         print((traceback.format_exc()))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import os
+import re
+
+from sysfs import read_text, Snapshot
+
+# CPU topology from sysfs: sockets, physical cores, SMT width, NUMA nodes
+# and cache sizes, read in one pass over /sys/devices/system/cpu and
+# /sys/devices/system/node without running lscpu.
+
+CPU_PATH = '/sys/devices/system/cpu'
+NODE_PATH = '/sys/devices/system/node'
+
+_snapshot = Snapshot()
+
+
+# Expand a kernel cpu list such as "0-3,8-11" into [0, 1, 2, 3, 8, ...].
+def parse_cpulist(text):
+    cpus = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.append(int(part))
+
+    return cpus
+
+
+# A cache size such as "1024K" or "32M" in KiB.
+def parse_size(text):
+    match = re.match(r'(\d+)\s*([KMG]?)', text)
+    if not match:
+        return 0
+
+    return int(match.group(1)) * {'': 1, 'K': 1, 'M': 1024, 'G': 1024 * 1024}[match.group(2)]
+
+
+class Topology:
+    def __init__(self, cpu_path=CPU_PATH, node_path=NODE_PATH):
+        self.cpus = parse_cpulist(read_text(os.path.join(cpu_path, 'online')))
+        packages = set()
+        cores = set()
+        caches = {}
+
+        for cpu in self.cpus:
+            base = os.path.join(cpu_path, 'cpu{0}'.format(cpu))
+            packages.add(read_text(os.path.join(base, 'topology', 'physical_package_id')))
+            # Threads of one core share a sibling list, so each distinct list
+            # is one physical core whatever the SMT width.
+            cores.add(read_text(os.path.join(base, 'topology', 'thread_siblings_list')))
+
+            cache_path = os.path.join(base, 'cache')
+            try:
+                indexes = os.listdir(cache_path)
+            except OSError:
+                indexes = []
+            for index in indexes:
+                path = os.path.join(cache_path, index)
+                if read_text(os.path.join(path, 'type')) == 'Instruction':
+                    continue
+                level = read_text(os.path.join(path, 'level'))
+                shared = read_text(os.path.join(path, 'shared_cpu_list'))
+                caches[(level, shared)] = parse_size(read_text(os.path.join(path, 'size')))
+
+        self.sockets = len(packages)
+        self.cores = len(cores)
+        self.smt = max([len(parse_cpulist(siblings)) for siblings in cores if siblings] or [1])
+
+        # Per-core L2 and the total of every distinct L3 instance.
+        l2 = [size for (level, shared), size in caches.items() if level == '2']
+        l3 = [size for (level, shared), size in caches.items() if level == '3']
+        self.l2 = max(l2) if l2 else 0
+        self.l3 = sum(l3)
+
+        self.nodes = self.read_nodes(node_path)
+
+    # Each NUMA node's CPUs and memory in MiB.
+    def read_nodes(self, node_path):
+        try:
+            names = [name for name in os.listdir(node_path) if re.match(r'node\d+$', name)]
+        except OSError:
+            return []
+
+        nodes = []
+        for name in sorted(names, key=lambda name: int(name[4:])):
+            path = os.path.join(node_path, name)
+            meminfo = read_text(os.path.join(path, 'meminfo'))
+            memory = re.search(r'MemTotal:\s+(\d+)\s*kB', meminfo)
+            nodes.append({
+                'node': int(name[4:]),
+                'cpus': read_text(os.path.join(path, 'cpulist')),
+                'memory_mb': int(memory.group(1)) // 1024 if memory else 0,
+            })
+
+        return nodes
+
+    def as_dict(self):
+        return {
+            'sockets': self.sockets,
+            'cores': self.cores,
+            'threads': len(self.cpus),
+            'smt': self.smt,
+            'l2cache': self.l2,
+            'l3cache': self.l3,
+            'numa': self.nodes,
+        }
+
+
+# The topology for this run, read on first use.
+def snapshot(cpu_path=CPU_PATH, node_path=NODE_PATH):
+    return _snapshot.get(Topology, cpu_path, node_path)
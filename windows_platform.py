@@ -1,13 +1,14 @@
 #!/usr/bin/env python
 
 import os
+import re
 import sys
-from subprocess import Popen, PIPE
-from cross_platform import CrossPlatform
+from probe_runner import run_cmd
+from classify import classifier
+from cross_platform import CP
 
 import config
 
-CP = CrossPlatform()
 
 # Platform for windows-y ways of getting hardware information.
 class WindowsPlatform:
@@ -15,8 +16,7 @@ class WindowsPlatform:
     # location, and the three d2 locations are determined by IP addresses.
     def get_location(self):
         cmddom = ['wmic', 'computersystem', 'get', 'domain']
-        rundom = Popen(cmddom, stdout=PIPE)
-        domain = rundom.communicate()[0].strip().split(b'\r\r\n')[1]
+        domain = run_cmd(cmddom).strip().split(b'\r\r\n')[1]
 
         if domain == 'la.company.com':
             location = 'losangeles'
@@ -24,7 +24,7 @@ class WindowsPlatform:
             location = 'vancouver'
         # Infer some known VLANs for actual locations in CA.
         elif domain == 'company.com':
-            ip_vlan = int(CrossPlatform().get_ip().split(b'.', 2)[1])
+            ip_vlan = int(CP.get_ip().split(b'.', 2)[1])
 
             if ip_vlan == 147:
                 location = 'losangeles'
@@ -42,8 +42,7 @@ class WindowsPlatform:
     def get_mb_serial(self):
         mbserial = ''
         cmdmbserial = ['wmic', 'baseboard', 'get', 'serialnumber']
-        runmbserial = Popen(cmdmbserial, stdout=PIPE)
-        mbserial = runmbserial.communicate()[0].strip().split(b'\r\r\n')[1]
+        mbserial = run_cmd(cmdmbserial).strip().split(b'\r\r\n')[1]
         mbserial = mbserial.decode("utf-8")
 
         return mbserial
@@ -53,8 +52,7 @@ class WindowsPlatform:
         cmdram = [
             'powershell',
             '(Get-WMIObject Win32_PhysicalMemory | Measure-Object Capacity -Sum).sum/1GB']
-        runram = Popen(cmdram, stdout=PIPE)
-        ram = runram.communicate()[0].strip().split(b'.')[0]
+        ram = run_cmd(cmdram).strip().split(b'.')[0]
         ram = ram.decode("utf-8")
 
         return ram
@@ -64,8 +62,7 @@ class WindowsPlatform:
         cmdramspeed = [
             'powershell',
             '((Get-WMIObject CIM_PhysicalMemory).Speed | Get-Unique)']
-        runramspeed = Popen(cmdramspeed, stdout=PIPE)
-        ramspeed = runramspeed.communicate()[0].strip()
+        ramspeed = run_cmd(cmdramspeed).strip()
         ramspeed = ramspeed.decode("utf-8")
 
         return ramspeed
@@ -75,28 +72,35 @@ class WindowsPlatform:
         cmdssd = [
             'powershell',
             '(Get-WmiObject win32_diskdrive | where{$_.model -Like "*SSD*"} | select-object -expand SerialNumber)']
-        runssd = Popen(cmdssd, stdout=PIPE)
-        ssd = runssd.communicate()[0].strip().replace(b"\r\n", b", ")
+        ssd = run_cmd(cmdssd).strip().replace(b"\r\n", b", ")
         ssd = ssd.decode("utf-8")
 
         return ssd
 
+    # Structured disk records come from sysfs, so aren't available here.
+    def get_disks(self):
+        return []
+
+    # The sysfs device inventory has no Windows counterpart yet.
+    def get_devices(self):
+        return []
+
     # Get an attached tablet on the system. May be useful to know.
     def get_tablet(self):
         cmdtablet = [
             'powershell',
             '(get-wmiobject win32_pnpentity | where {$_.caption -eq "Wacom Tablet"} | select-object -Expand deviceid)']
-        runtablet = Popen(cmdtablet, stdout=PIPE)
-        try:
-            tablet = runtablet.communicate()[0].split(b'\\')[1].split(b'&')[1]
-            tablet = config.windows_tablet_dict[tablet]
-        except BaseException:
-            tablet = ''
+        deviceid = run_cmd(cmdtablet).strip()
+        if not deviceid:
+            return ''
+
+        tablet = deviceid.split(b'\\')[1].split(b'&')[1]
+        tablet = classifier(config.windows_tablet_dict, re.IGNORECASE).classify(tablet)
 
         return tablet
 
     # Get up to 2 connected monitors.
-    def get_monitor_info(self):
+    def get_monitors(self):
         cmdmon = [
             'powershell',
             '-ExecutionPolicy',
@@ -105,38 +109,34 @@ class WindowsPlatform:
             os.path.join(
                 sys.path[0],
                 'moninfo.ps1')]
-        runmon = Popen(cmdmon, stdout=PIPE)
-        mon = runmon.communicate()[0].strip().replace(b"\r\n", b":").replace(b" ", b"")
+        mon = run_cmd(cmdmon).strip().replace(b"\r\n", b":").replace(b" ", b"")
         mon = mon.replace(b"\x00", b"")
         mon = mon.decode("utf-8")
         mon = mon.split(":")
-        
-        try:
-            monitor1 = mon[7]
-        except BaseException:
-            monitor1 = ''
-        try:
-            serial1 = mon[9]
-        except BaseException:
-            serial1 = ''
-        try:
-            monitor2 = mon[22]
-        except BaseException:
-            monitor2 = ''
-        try:
-            serial2 = mon[24]
-        except BaseException:
-            serial2 = ''
-
-        return monitor1, serial1, monitor2, serial2
+
+        # Fields moninfo.ps1 didn't print, for a second monitor that isn't
+        # there, are empty.
+        def field(index):
+            return mon[index] if index < len(mon) else ''
+
+        monitor1 = field(7)
+        serial1 = field(9)
+        monitor2 = field(22)
+        serial2 = field(24)
+
+        return [{'model': model, 'serial': serial}
+                for model, serial in [(monitor1, serial1), (monitor2, serial2)] if model or serial]
+
+    # Windows has no wtmp to list recent logins from.
+    def get_recent_logins(self, count=None):
+        return []
 
     # Get the last logged in user.
     def get_last_info(self):
         cmdlast = [
             'powershell',
             r'(Get-ItemProperty "hklm:SOFTWARE\Microsoft\Windows\CurrentVersion\Authentication\LogonUI").LastLoggedOnUser']
-        runlast = Popen(cmdlast, stdout=PIPE)
-        lastuser = runlast.communicate()[0].strip()
+        lastuser = run_cmd(cmdlast).strip()
         lastuser = lastuser.decode("utf-8")
 
         if '@' in lastuser:
@@ -152,8 +152,7 @@ class WindowsPlatform:
             '")).Translate([System.Security.Principal.SecurityIdentifier]).Value)} | Sort-Object -Property LastUseTime -Descending | Select-Object -First 1).converttodatetime((Get-WMIObject -Class Win32_UserProfile | Where-Object {($_.SID -match (New-Object System.Security.Principal.NTAccount("' +
             lastuser +
             '")).Translate([System.Security.Principal.SecurityIdentifier]).Value)} | Sort-Object -Property LastUseTime -Descending | Select-Object -First 1).lastusetime).tostring("yyyy-MM-dd")']
-        runlastlogon = Popen(cmdlastlogon, stdout=PIPE)
-        lastlogon = runlastlogon.communicate()[0].strip()
+        lastlogon = run_cmd(cmdlastlogon).strip()
 
         # Nobody logged in yet (shouldn't happen?)
         if b'FullyQualifiedErrorId' in lastlogon:
@@ -166,14 +165,17 @@ class WindowsPlatform:
 
         return lastuser, lastlogon
 
+    # The sysfs topology probe has no Windows counterpart yet.
+    def get_topology(self):
+        return {}
+
     # Get proc count on this machine. May be useful for Race.
     def get_procs(self, hyperthread_reporting_enabled):
         cmdprocs = [
             'powershell',
             '(Get-WmiObject win32_processor).NumberOfCores']
-        runprocs = Popen(cmdprocs, stdout=PIPE)
         procs = 0
-        winprocs = runprocs.communicate()[0].split(b'\r\n')
+        winprocs = run_cmd(cmdprocs).split(b'\r\n')
         winprocs.remove(b'')
         for line in winprocs:
             procs = procs + int(line)
@@ -181,22 +183,18 @@ class WindowsPlatform:
         cmdlprocs = [
             'powershell',
             '(Get-WmiObject win32_processor).NumberOfLogicalProcessors']
-        runlprocs = Popen(cmdlprocs, stdout=PIPE)
-        winlprocs = runlprocs.communicate()[0].split(b'\r\n')
+        winlprocs = run_cmd(cmdlprocs).split(b'\r\n')
         winlprocs.remove(b'')
 
         for line in winlprocs:
             lprocs = lprocs + int(line)
         cmdcpuname = ['powershell', '(Get-WmiObject win32_processor).Name']
-        runcpuname = Popen(cmdcpuname, stdout=PIPE)
 
-        try:
-            cpulist = runcpuname.communicate()[0].strip(b'\r\n').split()
+        cpulist = run_cmd(cmdcpuname).strip(b'\r\n').split()
+        if b'CPU' in cpulist:
             cpulist.remove(b'CPU')
-            cpulist = [entry.decode("utf-8") for entry in cpulist]
-            cpuname = " ".join(cpulist)
-        except BaseException:
-            cpuname = ''
+        cpulist = [entry.decode("utf-8") for entry in cpulist]
+        cpuname = " ".join(cpulist)
         if procs != lprocs:
             hyperthread = 1
         else:
@@ -214,8 +212,7 @@ class WindowsPlatform:
             '(get-date)',
             '-',
             '(gcim Win32_OperatingSystem).LastBootUpTime']
-        runup = Popen(cmdup, stdout=PIPE)
-        uptime = runup.communicate()[0].strip(b'\r\n')
+        uptime = run_cmd(cmdup).strip(b'\r\n')
         uptime = uptime.decode("utf-8")
         uptime = uptime.replace(" ", "").replace("\r\n", ":")
         uptime = uptime.split(":")
@@ -226,8 +223,7 @@ class WindowsPlatform:
     # See if the machine has an NVME for tracking purposes.
     def check_nvme(self):
         cmd = ['powershell', 'Get-Disk', '|', '?', 'model']
-        run = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        out, err = run.communicate()
+        out = run_cmd(cmd)
         out = out.decode("utf-8")
 
         if 'NVME' in out:
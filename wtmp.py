@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import datetime
+import mmap
+import struct
+
+# Reader for the glibc utmp/wtmp format, used instead of running `last`.
+# wtmp is an append-only array of fixed-size records, so the newest logins
+# are found by decoding records from the end of the file backwards, and only
+# as many records as needed are touched.
+
+WTMP_PATH = '/var/log/wtmp'
+
+# struct utmp on Linux: type, pid, line, id, user, host, exit status,
+# session, time (seconds, microseconds), IPv6 address, reserved.
+UTMP_FORMAT = '<hxxi32s4s32s256shhiii4i20s'
+UTMP_SIZE = struct.calcsize(UTMP_FORMAT)
+
+USER_PROCESS = 7
+
+
+def text(raw):
+    return raw.split(b'\0', 1)[0].decode("utf-8", "replace")
+
+
+# Decoded records from the newest backwards, at most limit of them. Any
+# partial record at the end of the file (a write in progress) is skipped.
+def records(path=WTMP_PATH, limit=None):
+    try:
+        data = open(path, 'rb')
+    except (IOError, OSError):
+        return
+
+    with data:
+        try:
+            view = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file.
+            return
+
+        with view:
+            offset = (len(view) // UTMP_SIZE) * UTMP_SIZE
+            count = 0
+            while offset > 0 and (limit is None or count < limit):
+                offset -= UTMP_SIZE
+                count += 1
+                (ut_type, pid, line, ut_id, user, host, termination, exit_status,
+                 session, seconds, useconds) = struct.unpack_from(UTMP_FORMAT, view, offset)[:11]
+                yield {
+                    'type': ut_type,
+                    'pid': pid,
+                    'line': text(line),
+                    'user': text(user),
+                    'host': text(host),
+                    'time': seconds,
+                }
+
+
+# The newest user logins, newest first, as {user, line, host, time} with
+# time in local ISO format. Stops after count logins or after scanning
+# max_records records, whichever comes first.
+def logins(count, path=WTMP_PATH, max_records=None):
+    found = []
+    for record in records(path, max_records):
+        if record['type'] != USER_PROCESS or not record['user']:
+            continue
+        found.append({
+            'user': record['user'],
+            'line': record['line'],
+            'host': record['host'],
+            'time': datetime.datetime.fromtimestamp(record['time']).isoformat(' '),
+        })
+        if len(found) >= count:
+            break
+
+    return found